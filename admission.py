@@ -0,0 +1,139 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from ratelimit import TokenBucket
+
+
+# Token buckets by key, keeping only the most recently used max_keys
+class BucketMap:
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+
+    def get(self, key):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.burst)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket
+
+
+# Consecutive messages of one author in one channel, evaluated together
+class Burst:
+    __slots__ = ("contents", "future", "timer")
+
+    def __init__(self, content, future):
+        self.contents = [content]
+        self.future = future
+        self.timer = None
+
+
+# Admission control in front of the classifier, for messages that missed the verdict cache, the
+# near-duplicate index and the pre-filter. Consecutive such messages from the same author in the
+# same channel within `debounce` seconds are merged into one evaluation unit (merge), and each unit
+# must get a token from its user, channel and guild buckets before it is sent to the model (admit),
+# which bounds model calls per guild during a raid; a unit over budget waits up to max_delay seconds
+# for its tokens, and is reported as over budget after that so it can be logged for manual review. Authors with a recent violation skip the
+# debounce and the user/channel buckets so they are evaluated right away (the guild bucket still applies).
+class AdmissionControl:
+    def __init__(self, user_rate=0.2, user_burst=5, channel_rate=1.0, channel_burst=10, guild_rate=2.0, guild_burst=20,
+                 debounce=1.0, max_merge=5, max_delay=30.0, violation_ttl=600, max_keys=10000):
+        self.users = BucketMap(user_rate, user_burst, max_keys)
+        self.channels = BucketMap(channel_rate, channel_burst, max_keys)
+        self.guilds = BucketMap(guild_rate, guild_burst, max_keys)
+        self.debounce = debounce
+        self.max_merge = max_merge
+        self.max_delay = max_delay
+        self.violation_ttl = violation_ttl
+        self.max_keys = max_keys
+        self.violators = OrderedDict()  # (guild ID, author ID) -> expiry
+        self.bursts = {}  # (channel ID, author ID) -> Burst
+        self.admitted = 0
+        self.merged = 0
+        self.fast_path = 0
+        self.delayed = 0
+        self.rejected = {"user": 0, "channel": 0, "guild": 0}
+
+    def record_violation(self, guild_id, author_id):
+        """Mark an author as a recent violator (called when a moderation action is taken)."""
+        self.violators[(guild_id, author_id)] = time.monotonic() + self.violation_ttl
+        self.violators.move_to_end((guild_id, author_id))
+        while len(self.violators) > self.max_keys:
+            self.violators.popitem(last=False)
+
+    def is_violator(self, guild_id, author_id):
+        expiry = self.violators.get((guild_id, author_id))
+        if expiry is None:
+            return False
+        if expiry < time.monotonic():
+            del self.violators[(guild_id, author_id)]
+            return False
+        return True
+
+    async def merge(self, guild_id, channel_id, author_id, content):
+        """Return the text to evaluate for this message, or None if it was merged into another unit."""
+        if self.is_violator(guild_id, author_id):
+            self.fast_path += 1
+            return content
+
+        key = (channel_id, author_id)
+        burst = self.bursts.get(key)
+        if burst is not None and len(burst.contents) < self.max_merge:
+            burst.contents.append(content)
+            burst.timer.cancel()
+            burst.timer = asyncio.get_running_loop().call_later(self.debounce, self._close, key, burst)
+            self.merged += 1
+            return None
+
+        burst = self.bursts[key] = Burst(content, asyncio.get_running_loop().create_future())
+        burst.timer = asyncio.get_running_loop().call_later(self.debounce, self._close, key, burst)
+        return "\n".join(await burst.future)
+
+    def _close(self, key, burst):
+        if self.bursts.get(key) is burst:
+            del self.bursts[key]
+        if not burst.future.done():
+            burst.future.set_result(burst.contents)
+
+    async def admit(self, guild_id, channel_id, author_id):
+        """Take the tokens for one model call, waiting up to max_delay seconds; returns False if still over budget."""
+        if self.is_violator(guild_id, author_id):
+            buckets = [("guild", self.guilds.get(guild_id))]
+        else:
+            buckets = [("user", self.users.get(author_id)), ("channel", self.channels.get(channel_id)),
+                       ("guild", self.guilds.get(guild_id))]
+        deadline = time.monotonic() + self.max_delay
+        waited = False
+        while (name := self._take_tokens(buckets)) is not None:
+            delay = max(bucket.delay() for _, bucket in buckets)
+            if time.monotonic() + delay > deadline:
+                self.rejected[name] += 1
+                return False
+            if not waited:
+                self.delayed += 1
+                waited = True
+            await asyncio.sleep(delay)
+        self.admitted += 1
+        return True
+
+    @staticmethod
+    def _take_tokens(buckets):
+        """Take one token from every bucket, or none; returns the name of the bucket that was empty, or None."""
+        taken = []
+        for name, bucket in buckets:
+            if not bucket.try_acquire():
+                for earlier in taken:
+                    earlier.refund()
+                return name
+            taken.append(bucket)
+        return None
+
+    def stats(self):
+        return {"admitted": self.admitted, "merged": self.merged, "fast_path": self.fast_path, "delayed": self.delayed,
+                "rejected": dict(self.rejected)}
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import re
+import time
+
+from parsing import is_valid_output
+
+# Header prepended to the user message when several targets share one request
+BATCH_HEADER = ("Evaluate each of the following {count} items independently. Answer with one block per item, "
+                "starting with 'Item <number>:' followed by the output format for that item.")
+
+# Header used in JSON response mode
+JSON_BATCH_HEADER = ("Evaluate each of the following {count} items independently. Respond with a JSON object "
+                     "{{\"items\": [...]}} holding one output object per item, in item order.")
+
+# Marker that starts each item in a batched request/response
+ITEM_MARKER = re.compile(r'Item\s*(\d+)\s*:', re.IGNORECASE)
+
+def batch_input(inputs, json_mode=False):
+    """Pack several classification inputs into one user message."""
+    items = "\n\n".join(f"Item {i}: {input}" for i, input in enumerate(inputs, 1))
+    return (JSON_BATCH_HEADER if json_mode else BATCH_HEADER).format(count=len(inputs)) + "\n\n" + items
+
+def split_json_batch(output, count):
+    results = [None] * count
+    try:
+        items = json.loads(output).get("items")
+    except (ValueError, AttributeError):
+        return results
+    if isinstance(items, list):
+        for index, item in enumerate(items[:count]):
+            segment = json.dumps(item)
+            if is_valid_output(segment):
+                results[index] = segment
+    return results
+
+def split_batch(output, count):
+    """Split a batched model output into per-item outputs (None where an item is missing or malformed)."""
+    if output.lstrip().startswith("{"):
+        return split_json_batch(output, count)
+    results = [None] * count
+    marks = list(ITEM_MARKER.finditer(output))
+    for k, mark in enumerate(marks):
+        end = marks[k + 1].start() if k + 1 < len(marks) else len(output)
+        index = int(mark.group(1)) - 1
+        segment = output[mark.end():end].strip()
+        if 0 <= index < count and results[index] is None and is_valid_output(segment):
+            results[index] = segment
+    return results
+
+
+# Micro-batching stage in front of the classification engine. Targets are collected (across
+# channels) until max_batch are pending or max_wait seconds have passed since the first one,
+# then sent as a single request so the long system prompt is paid once per batch. Single
+# targets and items missing from a batched output go through the recovery strategy. Once at
+# least min_split_items batched items were sent, batching is turned off if more than
+# max_split_failure_rate of them were missing from the model's output (each one costs an extra call).
+class MicroBatcher:
+    def __init__(self, recovery, max_batch=4, max_wait=0.2, report_every=100, json_mode=False, max_split_failure_rate=0.2,
+                 min_split_items=40):
+        self.recovery = recovery
+        self.engine = recovery.engine
+        self.json_mode = json_mode
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.report_every = report_every
+        self.max_split_failure_rate = max_split_failure_rate
+        self.min_split_items = min_split_items
+        self.split_items = 0  # Items sent in batches of more than one
+        self.split_failures = 0  # Of those, items missing or malformed in the batched output
+        self.pending = []
+        self.batches = 0
+        self.stats = {}  # batch size -> [batches, items, total latency, max latency]
+        self._timer = None
+        self._running = set()
+
+    async def classify(self, input):
+        """Classify one input and return its model output, or None if no valid output was produced."""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((input, future))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self.flush)
+        return await future
+
+    def flush(self):
+        """Send everything pending now."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = [(input, future) for input, future in self.pending if not future.done()]
+        self.pending = []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        start = time.perf_counter()
+        try:
+            if len(batch) == 1:
+                results = [await self.recovery.classify(batch[0][0])]
+            else:
+                self.recovery.outputs += len(batch)
+                completion = await self.engine.classify(batch_input([input for input, _ in batch], self.json_mode))
+                results = split_batch(completion.choices[0].message.content or "", len(batch))
+                # Items the model dropped or mangled are retried on their own (one extra round-trip)
+                missing = [i for i, result in enumerate(results) if result is None]
+                self._record_split(len(batch), len(missing))
+                if missing:
+                    retries = await asyncio.gather(*(self.recovery.recover(batch[i][0]) for i in missing))
+                    for i, content in zip(missing, retries):
+                        results[i] = content
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self._record(len(batch), time.perf_counter() - start)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _record_split(self, items, failures):
+        self.split_items += items
+        self.split_failures += failures
+        if (self.max_batch > 1 and self.split_items >= self.min_split_items
+                and self.split_failures > self.max_split_failure_rate * self.split_items):
+            print(f"Batching disabled: {self.split_failures} of {self.split_items} batched items were missing from the "
+                  f"model output.")
+            self.max_batch = 1
+
+    def _record(self, size, latency):
+        stats = self.stats.setdefault(size, [0, 0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += size
+        stats[2] += latency
+        stats[3] = max(stats[3], latency)
+        self.batches += 1
+        if self.report_every and self.batches % self.report_every == 0:
+            for line in self.report():
+                print(line)
+
+    def report(self):
+        """Latency and throughput per batch size, one line each."""
+        lines = []
+        for size in sorted(self.stats):
+            batches, items, total, worst = self.stats[size]
+            lines.append(f"batch size {size}: {batches} batches, mean latency {total / batches:.3f}s, "
+                         f"max latency {worst:.3f}s, throughput {items / total if total else 0:.2f} msg/s")
+        return lines
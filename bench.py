@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import json
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from admission import AdmissionControl
+from batching import MicroBatcher
+from classifier import ClassificationEngine
+from context_buffer import ContextBuffer
+from fakes import FakeAsyncOpenAI, FakeDriveBackend, FakeBot, FakeChannel, FakeMessage, FakeUser, lognormal_latency
+from feedback_sink import FeedbackSink
+from guild_store import GuildStore
+from log_dispatcher import LogDispatcher
+from metrics import Registry
+from near_dup import NearDuplicateIndex
+from pipeline import MessagePipeline, PipelineMetrics
+from prefilter import Prefilter
+from prompts import MODEL, role
+from recovery import RecoveryStrategy
+from reviews import ReviewStore
+from verdict_cache import VerdictCache
+
+LOGS_CHANNEL = 1
+WORDS = ("the", "a", "you", "we", "they", "game", "server", "lol", "why", "is", "this", "so", "bad", "good", "people",
+         "never", "always", "play", "again", "what", "here", "there", "team", "match", "today", "ok", "no", "yes")
+
+
+def vary(text, rng):
+    """A slight variation of text: casing, punctuation, leetspeak or one inserted word."""
+    kind = rng.randrange(4)
+    if kind == 0:
+        return text.upper() if rng.random() < 0.5 else text.capitalize()
+    if kind == 1:
+        return text + rng.choice(("!!!", "?", "...", " !!"))
+    if kind == 2:
+        return text.translate(str.maketrans({"o": "0", "e": "3", "a": "4", "s": "$"}))
+    words = text.split()
+    words.insert(rng.randrange(len(words) + 1), rng.choice(WORDS))
+    return " ".join(words)
+
+def synthetic_stream(count, guilds=10, channels=50, users=500, repeat=0.1, variants=0.0, reply=0.1, burst=0.2, seed=0):
+    """Synthetic message events: {"guild", "channel", "author", "content", "reply_to"} (reply_to is an event index).
+
+    A share repeat of messages copies an earlier message and a share variants is a slight variation of one.
+    """
+    rng = random.Random(seed)
+    events = []
+    for i in range(count):
+        if events and rng.random() < burst:
+            # Same author again in the same channel
+            event = dict(events[-1], content=" ".join(rng.choices(WORDS, k=rng.randint(2, 12))), reply_to=None)
+        else:
+            channel = rng.randrange(channels)
+            event = {"guild": channel % guilds, "channel": channel, "author": rng.randrange(users),
+                     "content": " ".join(rng.choices(WORDS, k=rng.randint(2, 20))), "reply_to": None}
+        draw = rng.random()
+        if events and draw < repeat:
+            event["content"] = rng.choice(events)["content"]
+        elif events and draw < repeat + variants:
+            event["content"] = vary(rng.choice(events)["content"], rng)
+        if events and rng.random() < reply:
+            event["reply_to"] = rng.randrange(len(events))
+        events.append(event)
+    return events
+
+def load_stream(path):
+    """Recorded message events, one JSON object per line (same fields as synthetic_stream)."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+# The message pipeline wired to fake Discord, OpenAI and Drive backends, in one process
+class Harness:
+    def __init__(self, args):
+        seed = args.seed
+        self.registry = Registry()
+        self.metrics = PipelineMetrics(self.registry)
+        self.client = FakeAsyncOpenAI(latency=lognormal_latency(args.openai_latency, args.sigma, seed))
+        self.engine = ClassificationEngine(self.client, MODEL, role, workers=args.workers, max_pending=64, timeout=30.0,
+                                           observe=self.metrics.observe_completion)
+        self.recovery = RecoveryStrategy(self.engine, mode="retry", retries=1)
+        self.batcher = MicroBatcher(self.recovery, max_batch=args.batch_size, max_wait=args.batch_wait, report_every=0)
+        self.discord_latency = lognormal_latency(args.discord_latency, args.sigma, seed + 1)
+        self.channels = {}
+        self.bot = FakeBot([FakeChannel(LOGS_CHANNEL, None, latency=self.discord_latency)])
+        self.guilds = GuildStore(':memory:', default_logschannel=LOGS_CHANNEL)
+        if args.no_admission:
+            self.admission = AdmissionControl(user_rate=1e9, user_burst=1e9, channel_rate=1e9, channel_burst=1e9,
+                                              guild_rate=1e9, guild_burst=1e9, debounce=0)
+        else:
+            self.admission = AdmissionControl(debounce=args.debounce)
+        self.logs = LogDispatcher(self.bot, rate=1.0, burst=5, max_queue=500,
+                                  observe=lambda seconds: self.metrics.stage_seconds.observe(seconds, "log_send"))
+        self.reviews = ReviewStore(':memory:')
+        self.drive = FakeDriveBackend(lognormal_latency(args.drive_latency, args.sigma, seed + 2))
+        self.feedback = FeedbackSink(self.drive, directory=tempfile.mkdtemp(prefix="ufoh-bench-"), flush_interval=1)
+        self.feedback_rate = args.feedback_rate
+        self.random = random.Random(seed)
+        self.submissions = set()
+        self.pipeline = MessagePipeline(
+            self.bot, self.guilds, self.admission, ContextBuffer(per_channel=50, max_channels=1000),
+            VerdictCache(max_entries=10000, ttl=6 * 60 * 60), Prefilter.from_file(args.prefilter) if args.prefilter else None,
+            self.batcher, self.reviews, self.post_log, self.review_view, self.metrics,
+            near_duplicates=NearDuplicateIndex(threshold=args.near_dup) if args.near_dup is not None else None)
+
+    def post_log(self, config, priority, content, view=None):
+        # Same as main.post_log, with the text standing in for the embed
+        if config.logging and config.logschannel is not None:
+            self.logs.post(config.logschannel, priority, content[:4096], view, sample=config.flags.get('benign_log_sample', 1.0))
+
+    def review_view(self, record):
+        # A share of reviews is submitted as fine-tuning feedback right away
+        if self.random.random() < self.feedback_rate:
+            task = asyncio.create_task(self.feedback.submit({"id": record.id, "output": record.output()}))
+            self.submissions.add(task)
+            task.add_done_callback(self.submissions.discard)
+        return record
+
+    def message(self, index, event, sent):
+        channel = self.channels.get(event["channel"])
+        if channel is None:
+            guild = SimpleNamespace(id=1000 + event["guild"])
+            channel = self.channels[event["channel"]] = FakeChannel(2000 + event["channel"], guild, latency=self.discord_latency)
+        reference = None
+        if event.get("reply_to") is not None and event["reply_to"] < len(sent):
+            original = sent[event["reply_to"]]
+            reference = SimpleNamespace(channel_id=original.channel.id, message_id=original.id, resolved=None)
+        message = FakeMessage(10 ** 6 + index, channel, FakeUser(3000 + event["author"]), event["content"], reference)
+        channel.messages.append(message)
+        return message
+
+    async def run(self, events, rate):
+        """Replay events at rate messages per second; returns per-message latencies and the wall time."""
+        self.engine.start()
+        self.feedback.start()
+        self.reviews.start()
+        latencies = []
+        sent = []
+        tasks = []
+
+        async def timed(message):
+            start = time.perf_counter()
+            await self.pipeline.handle(message)
+            latencies.append(time.perf_counter() - start)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for index, event in enumerate(events):
+            delay = start + index / rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            message = self.message(index, event, sent)
+            sent.append(message)
+            tasks.append(asyncio.create_task(timed(message)))
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - start
+        await asyncio.gather(*self.submissions)
+        await self.feedback.flush()
+        await self.reviews.flush()
+        await self.engine.stop()
+        return sorted(latencies), elapsed
+
+
+def report(harness, events, latencies, elapsed, rate):
+    stages = {labels[0]: (total / count if count else 0.0, count)
+              for labels, (_, total, count) in harness.metrics.stage_seconds.series.items()}
+    sources = {labels[0]: value for labels, value in harness.metrics.verdict_sources.values.items()}
+    tokens = {labels[0]: value for labels, value in harness.metrics.openai_tokens.values.items()}
+    return {
+        "messages": len(events),
+        "target_rate": rate,
+        "seconds": elapsed,
+        "throughput": len(events) / elapsed if elapsed else 0.0,
+        "latency_ms": {name: percentile(latencies, fraction) * 1000
+                       for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))},
+        "stages_ms": {stage: {"mean": mean * 1000, "count": count} for stage, (mean, count) in sorted(stages.items())},
+        "verdict_sources": sources,
+        "model_calls": harness.client.calls,
+        "tokens": tokens,
+        "admission": harness.admission.stats(),
+        "skipped": dict(harness.metrics.skipped),
+        "logs": {"sent": harness.logs.sent, "messages": harness.logs.messages, "queued": harness.logs.depth(),
+                 "dropped": harness.logs.dropped},
+        "feedback_uploads": harness.drive.uploads,
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+def print_report(result):
+    latency = result["latency_ms"]
+    print(f"{result['messages']} messages in {result['seconds']:.2f}s ({result['throughput']:.1f} msg/s, target {result['target_rate']:g})")
+    print(f"latency p50 {latency['p50']:.1f}ms, p90 {latency['p90']:.1f}ms, p99 {latency['p99']:.1f}ms, max {latency['max']:.1f}ms")
+    for stage, stats in result["stages_ms"].items():
+        print(f"  {stage:<10} mean {stats['mean']:.2f}ms over {stats['count']}")
+    print(f"verdicts by source: {result['verdict_sources']}, model calls: {result['model_calls']}, tokens: {result['tokens']}")
+    print(f"admission: {result['admission']}, skipped: {result['skipped']}")
+    print(f"logs: {result['logs']}, feedback uploads: {result['feedback_uploads']}")
+    print(f"max RSS {result['max_rss_kib'] / 1024:.1f} MiB" + (f", peak traced {result['traced_peak_kib'] / 1024:.1f} MiB"
+                                                             if "traced_peak_kib" in result else ""))
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a message stream through the moderation pipeline with fake backends")
+    parser.add_argument("--replay", help="JSONL file of recorded events (default: a synthetic stream)")
+    parser.add_argument("--messages", type=int, default=2000, help="Synthetic stream length")
+    parser.add_argument("--rate", type=float, default=200, help="Messages per second")
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--repeat", type=float, default=0.1, help="Share of messages repeating an earlier one")
+    parser.add_argument("--variants", type=float, default=0.0, help="Share of messages varying an earlier one slightly")
+    parser.add_argument("--openai-latency", type=float, default=0.8, help="Median completion latency in seconds")
+    parser.add_argument("--discord-latency", type=float, default=0.1, help="Median Discord REST latency in seconds")
+    parser.add_argument("--drive-latency", type=float, default=0.5, help="Median Drive upload latency in seconds")
+    parser.add_argument("--sigma", type=float, default=0.5, help="Lognormal shape of every latency distribution")
+    parser.add_argument("--workers", type=int, default=8, help="Classification engine workers")
+    parser.add_argument("--batch-size", type=int, default=1, help="Targets per request (default: main.py's BATCH_SIZE)")
+    parser.add_argument("--batch-wait", type=float, default=0.2)
+    parser.add_argument("--debounce", type=float, default=1.0)
+    parser.add_argument("--no-admission", action="store_true", help="Disable admission control (no debounce or budgets)")
+    parser.add_argument("--prefilter", help="Pre-filter model file")
+    parser.add_argument("--near-dup", type=float, help="Reuse near-duplicate verdicts at this similarity threshold")
+    parser.add_argument("--feedback-rate", type=float, default=0.05, help="Share of reviews submitted as feedback")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also trace Python allocations (slower)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the results to this file (e.g. to keep as a baseline)")
+    args = parser.parse_args()
+
+    if args.replay:
+        events = load_stream(args.replay)
+    else:
+        events = synthetic_stream(args.messages, args.guilds, args.channels, args.users, args.repeat, args.variants, seed=args.seed)
+    if args.tracemalloc:
+        tracemalloc.start()
+    harness = Harness(args)
+    latencies, elapsed = asyncio.run(harness.run(events, args.rate))
+    result = report(harness, events, latencies, elapsed, args.rate)
+    if args.tracemalloc:
+        result["traced_peak_kib"] = tracemalloc.get_traced_memory()[1] / 1024
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from parsing import REQUIRED_FIELDS
+from prompts import dataset_role, format_input, NO_CONTEXT
+
+COLUMNS = ["comment_id", "text"] + list(REQUIRED_FIELDS)
+
+def load_censor_words():
+    # Worker process initializer
+    from better_profanity import profanity
+    profanity.load_censor_words()
+
+def censor(texts):
+    """Censor profanity in a list of texts (runs in a worker process)."""
+    from better_profanity import profanity
+    return [profanity.censor(text) for text in texts]
+
+def split_of(comment_id, validation):
+    """Stable train/validation assignment: every annotation of a comment lands in the same split."""
+    return "validation" if zlib.crc32(str(comment_id).encode()) % 10000 < validation * 10000 else "train"
+
+def format_outputs(df):
+    """Assistant outputs for a chunk, built column-wise."""
+    output = "hate_speech_score: " + df["hate_speech_score"].astype(str)
+    for field in REQUIRED_FIELDS[1:]:
+        output = output + f" {field}: " + df[field].astype(bool).astype(str)
+    return output
+
+def format_inputs(texts):
+    prefix = format_input(NO_CONTEXT, "N/A", "")
+    return prefix + texts
+
+
+# Writes records to numbered JSONL shards of at most shard_size lines: <out>/<split>-00000.jsonl, ...
+class ShardWriter:
+    def __init__(self, directory, split, shard_size):
+        self.directory = directory
+        self.split = split
+        self.shard_size = shard_size
+        self.shard = -1
+        self.lines = shard_size
+        self.file = None
+        self.total = 0
+
+    def write(self, line):
+        if self.lines >= self.shard_size:
+            self.close()
+            self.shard += 1
+            self.lines = 0
+            self.file = open(os.path.join(self.directory, f"{self.split}-{self.shard:05d}.jsonl"), "w")
+        self.file.write(line)
+        self.lines += 1
+        self.total += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def iter_chunks(chunk_size):
+    """Stream the dataset as pandas DataFrames of chunk_size rows."""
+    import datasets
+    import pandas as pd
+
+    dataset = datasets.load_dataset('ucberkeley-dlab/measuring-hate-speech', split='train', streaming=True)
+    for batch in dataset.select_columns(COLUMNS).iter(batch_size=chunk_size):
+        yield pd.DataFrame(batch)
+
+def build(out, chunk_size=10000, shard_size=50000, validation=0.1, workers=None, limit=None):
+    """Build the fine-tuning JSONL shards; returns the number of records per split."""
+    os.makedirs(out, exist_ok=True)
+    writers = {split: ShardWriter(out, split, shard_size) for split in ("train", "validation")}
+    system = {"role": "system", "content": dataset_role}
+    seen = set()  # Comment IDs already written (the dataset has one row per annotator)
+    read = 0
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers, initializer=load_censor_words) as pool:
+        pending = None
+        for chunk in iter_chunks(chunk_size):
+            if limit is not None:
+                chunk = chunk.head(limit - read)
+            read += len(chunk)
+
+            # Deduplicate within the chunk and against earlier chunks
+            chunk = chunk.drop_duplicates("comment_id")
+            chunk = chunk[~chunk["comment_id"].isin(seen)]
+            seen.update(chunk["comment_id"].tolist())
+
+            # Censor this chunk in the pool while the previous one is serialized
+            texts = chunk["text"].tolist()
+            futures = [pool.submit(censor, texts[i::workers]) for i in range(workers)]
+            if pending is not None:
+                write_chunk(*pending, writers, system, validation)
+            pending = (chunk, futures)
+            if limit is not None and read >= limit:
+                break
+        if pending is not None:
+            write_chunk(*pending, writers, system, validation)
+    for writer in writers.values():
+        writer.close()
+    return {split: writer.total for split, writer in writers.items()}
+
+def write_chunk(chunk, futures, writers, system, validation):
+    import pandas as pd
+
+    # Reassemble the interleaved pieces in row order
+    pieces = [future.result() for future in futures]
+    censored = [None] * len(chunk)
+    for i, piece in enumerate(pieces):
+        censored[i::len(pieces)] = piece
+    inputs = format_inputs(pd.Series(censored, index=chunk.index, dtype=str))
+    outputs = format_outputs(chunk)
+    dumps = json.JSONEncoder(ensure_ascii=False).encode
+    for comment_id, input, output in zip(chunk["comment_id"], inputs, outputs):
+        record = {"messages": [system, {"role": "user", "content": input}, {"role": "assistant", "content": output}]}
+        writers[split_of(comment_id, validation)].write(dumps(record) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the fine-tuning JSONL dataset from measuring-hate-speech")
+    parser.add_argument("--out", default="dataset")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--shard-size", type=int, default=50000, help="Records per output file")
+    parser.add_argument("--validation", type=float, default=0.1, help="Share of comments in the validation split")
+    parser.add_argument("--workers", type=int, help="Censoring processes (default: one per CPU)")
+    parser.add_argument("--limit", type=int, help="Only read this many dataset rows")
+    args = parser.parse_args()
+    counts = build(args.out, args.chunk_size, args.shard_size, args.validation, args.workers, args.limit)
+    print(f"Wrote {counts['train']} training and {counts['validation']} validation records to {args.out}/")
+
+if __name__ == "__main__":
+    main()
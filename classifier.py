@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+
+class ClassificationTimeout(Exception):
+    """Raised when a completion takes longer than the per-request timeout."""
+
+
+# Async classification engine. Requests are queued and served by a fixed number of worker
+# tasks so that a slow completion only occupies one worker instead of the gateway event loop.
+# The queue is bounded: once it is full, callers wait for a free slot (back-pressure).
+class ClassificationEngine:
+    def __init__(self, client, model, role, workers=8, max_pending=64, timeout=30.0, observe=None, **options):
+        self.client = client  # openai.AsyncOpenAI (or anything with the same chat.completions.create coroutine)
+        self.model = model
+        self.role = role
+        self.workers = workers
+        self.timeout = timeout
+        self.options = options  # Extra keyword arguments for chat.completions.create
+        self.observe = observe  # Optional callback (seconds, completion) for every successful completion
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self._tasks = []
+
+    def start(self):
+        """Spawn the worker tasks on the running event loop (no-op if already running)."""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the workers and every request still waiting in the queue."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self.queue.empty():
+            _, future = self.queue.get_nowait()
+            future.cancel()
+            self.queue.task_done()
+
+    def pending(self):
+        """Number of requests waiting for a worker."""
+        return self.queue.qsize()
+
+    async def submit(self, input, **options):
+        """Queue a request and return a future resolving to its completion.
+
+        Waits while the queue is full. Cancelling the returned future cancels the request,
+        whether it is still queued or already in flight.
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((self._messages(input, options), future))
+        return future
+
+    async def classify(self, input, **options):
+        """Classify one input and return the raw chat completion.
+
+        Raises ClassificationTimeout if the model does not answer within the timeout. If the
+        caller is cancelled, the underlying request is cancelled too.
+        """
+        future = await self.submit(input, **options)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+    def _messages(self, input, options):
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self.role},
+                {"role": "user", "content": input}
+            ],
+            **self.options,
+            **options
+        }
+
+    async def _worker(self):
+        while True:
+            request, future = await self.queue.get()
+            try:
+                # Skip requests whose caller gave up while they were queued
+                if future.done():
+                    continue
+
+                started = time.perf_counter()
+                call = asyncio.ensure_future(asyncio.wait_for(self.client.chat.completions.create(**request), self.timeout))
+                future.add_done_callback(lambda _, call=call: call.cancel())
+                try:
+                    completion = await call
+                except asyncio.TimeoutError:
+                    if not future.done():
+                        future.set_exception(ClassificationTimeout(f"No completion after {self.timeout}s"))
+                except asyncio.CancelledError:
+                    # The caller cancelled the request: keep serving the queue
+                    if future.cancelled():
+                        continue
+                    # The worker itself is shutting down
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if self.observe is not None:
+                        self.observe(time.perf_counter() - started, completion)
+                    if not future.done():
+                        future.set_result(completion)
+            finally:
+                self.queue.task_done()
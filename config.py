@@ -0,0 +1,51 @@
+import json
+import os
+
+# Settings file read when present (JSON object); UFOH_CONFIG points to another path
+DEFAULT_PATH = 'ufoh.json'
+
+
+# Bot settings and secrets, looked up in order: environment variable UFOH_<KEY> (uppercase), the
+# settings file, then Colab `userdata` when running in a notebook. Keys are the names the bot used
+# with Colab secrets (botkey, openapikey, logschannel, ...).
+class Settings:
+    def __init__(self, values=None):
+        self.values = values or {}
+        self._userdata = None
+
+    def get(self, key, default=None):
+        value = os.environ.get(f"UFOH_{key.upper()}")
+        if value is None:
+            value = self.values.get(key)
+        if value is None:
+            value = self._colab(key)
+        return default if value is None else value
+
+    def require(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(f"Missing setting {key!r} (set UFOH_{key.upper()} or add it to {DEFAULT_PATH})")
+        return value
+
+    def _colab(self, key):
+        if self._userdata is None:
+            try:
+                from google.colab import userdata
+                self._userdata = userdata
+            except ImportError:
+                self._userdata = False
+        if not self._userdata:
+            return None
+        try:
+            return self._userdata.get(key)
+        except Exception:
+            return None
+
+def load_settings(path=None):
+    """Load the settings file (if it exists) and return the settings."""
+    path = path or os.environ.get("UFOH_CONFIG", DEFAULT_PATH)
+    values = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            values = json.load(f)
+    return Settings(values)
@@ -0,0 +1,93 @@
+import bisect
+from collections import OrderedDict
+
+
+# Recent messages of one channel, ordered by message ID (snowflakes are time-ordered)
+class ChannelBuffer:
+    __slots__ = ("ids", "contents", "complete")
+
+    def __init__(self):
+        self.ids = []
+        self.contents = {}
+        self.complete = False  # True once the buffer is known to hold the start of the channel
+
+
+# Per-channel ring buffer of recent messages, filled from the gateway events the bot already
+# receives, so the context of a new message does not need a history() REST call. A channel
+# only answers context lookups once it has been seeded from REST (after a restart, the first
+# message in a channel is a miss); from then on every new, edited or deleted message is seen.
+class ContextBuffer:
+    def __init__(self, per_channel=50, max_channels=1000):
+        self.per_channel = per_channel
+        self.max_channels = max_channels
+        self.channels = OrderedDict()  # channel ID -> ChannelBuffer, least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def _channel(self, channel_id, create=False):
+        buffer = self.channels.get(channel_id)
+        if buffer is not None:
+            self.channels.move_to_end(channel_id)
+        elif create:
+            buffer = self.channels[channel_id] = ChannelBuffer()
+            while len(self.channels) > self.max_channels:
+                self.channels.popitem(last=False)
+        return buffer
+
+    def add(self, channel_id, message_id, content):
+        """Record a new message (only for channels that are already being tracked)."""
+        buffer = self._channel(channel_id)
+        if buffer is not None:
+            self._insert(buffer, message_id, content)
+
+    def _insert(self, buffer, message_id, content):
+        if message_id not in buffer.contents:
+            bisect.insort(buffer.ids, message_id)
+            if len(buffer.ids) > self.per_channel:
+                for old in buffer.ids[:-self.per_channel]:
+                    del buffer.contents[old]
+                del buffer.ids[:-self.per_channel]
+                buffer.complete = False
+        buffer.contents[message_id] = content
+
+    def edit(self, channel_id, message_id, content):
+        buffer = self.channels.get(channel_id)
+        if buffer is not None and message_id in buffer.contents:
+            buffer.contents[message_id] = content
+
+    def delete(self, channel_id, message_id):
+        buffer = self.channels.get(channel_id)
+        if buffer is not None and message_id in buffer.contents:
+            del buffer.contents[message_id]
+            buffer.ids.remove(message_id)
+
+    def seed(self, channel_id, messages, limit):
+        """Fill a channel from a REST history fetch of up to limit (message ID, content) pairs."""
+        buffer = self._channel(channel_id, create=True)
+        for message_id, content in messages:
+            self._insert(buffer, message_id, content)
+        # Fewer messages than asked for means we have reached the start of the channel
+        if len(messages) < limit and len(buffer.ids) <= self.per_channel:
+            buffer.complete = True
+
+    def get(self, channel_id, message_id):
+        """Return the content of a buffered message, or None."""
+        buffer = self.channels.get(channel_id)
+        if buffer is None:
+            return None
+        return buffer.contents.get(message_id)
+
+    def before(self, channel_id, message_id, limit):
+        """Return the contents of up to limit messages before message_id (most recent first).
+
+        Returns None on a miss (channel not tracked, or not enough buffered messages), in which
+        case the caller should fetch the history over REST and seed() it.
+        """
+        buffer = self._channel(channel_id)
+        if buffer is not None:
+            end = bisect.bisect_left(buffer.ids, message_id)
+            if end >= limit or buffer.complete:
+                self.hits += 1
+                return [buffer.contents[i] for i in reversed(buffer.ids[max(0, end - limit):end])]
+        self.misses += 1
+        return None
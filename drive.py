@@ -0,0 +1,56 @@
+import os.path
+
+# Level of access to drive (for writing to a file)
+SCOPES = ['https://www.googleapis.com/auth/drive']
+
+
+class DriveAuthError(Exception):
+    """Raised when there are no usable saved credentials and the interactive login is not allowed."""
+
+
+# Login for Google Drive (needs access to a cloud file). The Google client libraries are imported here so
+# that they are not part of the bot's start-up.
+def service_account_login(interactive=False):
+    """Log in to Google API and return service object."""
+    from googleapiclient.discovery import build
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+
+    creds = None
+    # The file token.json stores the user's access and refresh tokens, and is
+    # created automatically when the authorization flow completes for the first time.
+    if os.path.exists('token.json'):
+        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
+    # If there are no (valid) credentials available, let the user log in.
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        elif interactive:
+            from google_auth_oauthlib.flow import InstalledAppFlow
+            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
+            creds = flow.run_local_server(port=0)
+        else:
+            raise DriveAuthError("No valid Drive credentials in token.json (run `python drive.py` to log in)")
+        # Save the credentials for the next run
+        with open('token.json', 'w') as token:
+            token.write(creds.to_json())
+
+    return build('drive', 'v3', credentials=creds)
+
+def read_file(service, file_name):
+    """Read file content from Google Drive."""
+    results = service.files().list(q=f"name='{file_name}'", fields="files(id, name)").execute()
+    items = results.get('files', [])
+    if not items:
+        print('No files found.')
+        return None
+    else:
+        file_id = items[0]['id']
+        request = service.files().get_media(fileId=file_id)
+        file = request.execute()
+        print(file)
+
+if __name__ == "__main__":
+    # One-time interactive login that saves token.json for the bot
+    service_account_login(interactive=True)
+    print("Saved Drive credentials to token.json")
@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import json
+import os
+
+from parsing import REQUIRED_FIELDS, parse_output, ParseError
+from prompts import MODEL, role, format_input, NO_CONTEXT
+from ratelimit import TokenBucket, is_rate_limit, retry_after
+
+# Display labels for each output field (as in the notebook's confusion matrices)
+LABELS = {
+    "hate_speech_score": ["Not Hate Speech", "Hate Speech"],
+    "target_race": ["Does Not Target Race", "Targets Race"],
+    "target_religion": ["Does Not Target Religion", "Targets Religion"],
+    "target_origin": ["Does Not Target Origin", "Targets Origin"],
+    "target_gender": ["Does Not Target Gender", "Targets Gender"],
+    "target_sexuality": ["Does Not Target Sexuality", "Targets Sexuality"],
+    "target_age": ["Does Not Target Age", "Targets Age"],
+    "target_disability": ["Does Not Target Disability", "Targets Disability"]
+}
+
+def load_checkpoint(path):
+    """Return the checkpointed results by dataset row index."""
+    results = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by an interrupted run
+                results[record["index"]] = record
+    return results
+
+
+# Runs the notebook's evaluation prompts with bounded concurrency, a requests-per-minute budget
+# and back-off on 429s, appending each result to a JSONL checkpoint as soon as it arrives.
+class Evaluator:
+    def __init__(self, client, model, checkpoint, concurrency=8, rpm=500, max_attempts=5):
+        self.client = client
+        self.model = model
+        self.checkpoint = checkpoint
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rpm / 60, capacity=concurrency)
+        self.max_attempts = max_attempts
+        self.completed = 0
+
+    async def evaluate_row(self, index, text, out):
+        async with self.semaphore:
+            input = format_input(NO_CONTEXT, "N/A", text)
+            for attempt in range(self.max_attempts):
+                await self.bucket.acquire()
+                try:
+                    completion = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": role},
+                            {"role": "user", "content": input}
+                        ]
+                    )
+                    break
+                except Exception as e:
+                    if not is_rate_limit(e) or attempt == self.max_attempts - 1:
+                        raise
+                    # Every request waits out the rate limit, not just this one
+                    self.bucket.pause(retry_after(e, default=2 ** attempt))
+            try:
+                verdict = parse_output(completion.choices[0].message.content)
+                record = {"index": index, **{field: getattr(verdict, field) for field in REQUIRED_FIELDS}}
+            except ParseError as e:
+                record = {"index": index, "error": str(e)}
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            self.completed += 1
+
+    async def run(self, rows):
+        """Evaluate (index, text) rows that are not in the checkpoint yet."""
+        done = load_checkpoint(self.checkpoint)
+        pending = [(index, text) for index, text in rows if index not in done]
+        print(f"{len(done)} rows already evaluated, {len(pending)} to go")
+        with open(self.checkpoint, "a") as out:
+            await asyncio.gather(*(self.evaluate_row(index, text, out) for index, text in pending))
+        return load_checkpoint(self.checkpoint)
+
+
+def prediction_arrays(df, results, indices):
+    """Truth and prediction matrices (rows x fields, 0/1) for rows with a valid verdict."""
+    import numpy as np
+
+    valid = np.array([i for i in indices if i in results and "error" not in results[i]], dtype=np.int64)
+    rows = df.loc[valid]
+    truth = np.empty((len(valid), len(REQUIRED_FIELDS)), dtype=np.int64)
+    pred = np.empty_like(truth)
+    truth[:, 0] = rows["hate_speech_score"].to_numpy() > 0
+    pred[:, 0] = np.array([results[i]["hate_speech_score"] for i in valid], dtype=float) > 0
+    for column, field in enumerate(REQUIRED_FIELDS[1:], 1):
+        truth[:, column] = rows[field].to_numpy() == True
+        pred[:, column] = np.array([results[i][field] for i in valid], dtype=bool)
+    return valid, truth, pred
+
+def confusion_matrices(truth, pred):
+    """2x2 confusion matrix ([[tn, fp], [fn, tp]]) for every field at once."""
+    import numpy as np
+
+    fields = truth.shape[1]
+    codes = truth * 2 + pred + 4 * np.arange(fields)
+    return np.bincount(codes.ravel(), minlength=4 * fields).reshape(fields, 2, 2)
+
+def summary(matrices):
+    """Per-field accuracy, precision, recall and F1 of the positive class from the confusion matrices."""
+    import numpy as np
+
+    tn, fp, fn, tp = (matrices[:, i, j].astype(float) for i, j in ((0, 0), (0, 1), (1, 0), (1, 1)))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.nan_to_num(tp / (tp + fp))
+        recall = np.nan_to_num(tp / (tp + fn))
+        f1 = np.nan_to_num(2 * precision * recall / (precision + recall))
+        accuracy = np.nan_to_num((tp + tn) / (tp + tn + fp + fn))
+    return accuracy, precision, recall, f1
+
+def print_summary(title, matrices):
+    accuracy, precision, recall, f1 = summary(matrices)
+    print(title)
+    print(f"{'field':<20}{'accuracy':>10}{'precision':>11}{'recall':>9}{'f1':>8}{'support':>9}")
+    for i, field in enumerate(REQUIRED_FIELDS):
+        print(f"{field:<20}{accuracy[i]:>10.3f}{precision[i]:>11.3f}{recall[i]:>9.3f}{f1[i]:>8.3f}{matrices[i, 1].sum():>9}")
+
+def plot(matrices):
+    import matplotlib.pyplot as plt
+    from sklearn import metrics
+
+    for field, matrix in zip(REQUIRED_FIELDS, matrices):
+        metrics.ConfusionMatrixDisplay(confusion_matrix=matrix, display_labels=LABELS[field]).plot()
+        plt.show()
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the model on the measuring-hate-speech dataset")
+    parser.add_argument("--start", type=int, default=1000)
+    parser.add_argument("--size", type=int, default=500)
+    parser.add_argument("--checkpoint", default="evaluation.jsonl", help="Results so far; an interrupted run resumes from it")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=float, default=500, help="Requests per minute budget")
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--mock", action="store_true", help="Use a fake OpenAI client (offline)")
+    parser.add_argument("--prefilter", help="Also report the tiered system using this pre-filter model")
+    parser.add_argument("--cutoff", type=float, default=0.05, help="Pre-filter benign cut-off")
+    parser.add_argument("--plot", action="store_true", help="Show the confusion matrices")
+    args = parser.parse_args()
+
+    from prefilter import load_dataset
+    df = load_dataset()
+    indices = list(range(args.start, args.start + args.size))
+
+    if args.mock:
+        from fakes import FakeAsyncOpenAI
+        client = FakeAsyncOpenAI()
+    else:
+        from openai import AsyncOpenAI
+        client = AsyncOpenAI()
+
+    evaluator = Evaluator(client, args.model, args.checkpoint, args.concurrency, args.rpm)
+    results = asyncio.run(evaluator.run([(i, df.loc[i, "text"]) for i in indices]))
+    valid, truth, pred = prediction_arrays(df, results, indices)
+    print(f"{len(valid)} valid verdicts, {sum(1 for i in indices if 'error' in results.get(i, {}))} unparseable outputs")
+    matrices = confusion_matrices(truth, pred)
+    print_summary("Model only", matrices)
+
+    if args.prefilter:
+        import numpy as np
+        from prefilter import HashedLinearModel
+
+        # Messages the pre-filter clears are predicted benign in every field
+        model = HashedLinearModel.load(args.prefilter)
+        escalated = np.array([model.score(text) >= args.cutoff for text in df.loc[valid, "text"]])
+        tiered = pred * escalated[:, None]
+        print(f"\nPre-filter cut-off {args.cutoff}: escalation rate {escalated.mean():.1%}, "
+              f"agreement with model only {(tiered == pred).all(axis=1).mean():.1%}")
+        print_summary("Tiered (pre-filter + model)", confusion_matrices(truth, tiered))
+
+    if args.plot:
+        plot(matrices)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import math
+import random
+import re
+import time
+from types import SimpleNamespace
+
+from batching import BATCH_HEADER
+from parsing import REQUIRED_FIELDS
+
+# Start of each item in a batched request
+BATCH_ITEM = re.compile(r"\n\nItem (\d+): ")
+
+
+class FakeRateLimitError(Exception):
+    """429 raised by FakeAsyncOpenAI (looks like openai.RateLimitError to ratelimit.is_rate_limit)."""
+    status_code = 429
+
+    def __init__(self, retry_after=1.0):
+        super().__init__("Rate limit reached (fake)")
+        self.response = SimpleNamespace(headers={"retry-after": str(retry_after)})
+
+
+def hashed_verdict(text):
+    """Deterministic pseudo verdict for a text, in the legacy output format."""
+    digest = hashlib.blake2b(text.encode(), digest_size=8).digest()
+    score = digest[0] % 9 - 4
+    flags = [bool(digest[1] >> bit & 1) and score > 0 for bit in range(len(REQUIRED_FIELDS) - 1)]
+    return f"hate_speech_score: {score} " + " ".join(f"{field}: {flag}" for field, flag in zip(REQUIRED_FIELDS[1:], flags))
+
+def target_verdict(input):
+    # Verdict depends on the target message only
+    return hashed_verdict(input.rsplit("Message To Evaluate:", 1)[-1])
+
+def default_responder(messages):
+    """One verdict per target, answering batched requests (see batching.batch_input) with one "Item k:" block each."""
+    content = messages[-1]["content"]
+    if not content.startswith(BATCH_HEADER.split("{count}")[0]):
+        return target_verdict(content)
+    items = BATCH_ITEM.split(content)[1:]  # [number, input, number, input, ...]
+    return "\n\n".join(f"Item {number}: {target_verdict(input)}" for number, input in zip(items[::2], items[1::2]))
+
+
+# Offline stand-in for openai.AsyncOpenAI: client.chat.completions.create(...) returns a completion-like
+# object whose content comes from responder(messages). latency is a callable returning seconds to wait.
+class FakeAsyncOpenAI:
+    def __init__(self, responder=default_responder, latency=lambda: 0.0, rate_limit_every=0, seed=0):
+        self.responder = responder
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every  # Raise a 429 on every nth call (0 = never)
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model=None, messages=(), n=1, **options):
+        self.calls += 1
+        if self.rate_limit_every and self.calls % self.rate_limit_every == 0:
+            raise FakeRateLimitError(retry_after=0.05)
+        await asyncio.sleep(self.latency())
+        content = self.responder(messages)
+        prompt_tokens = sum(len(message["content"]) for message in messages) // 4
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(index=i, message=SimpleNamespace(role="assistant", content=content)) for i in range(n)],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(content) // 4 * n,
+                                  total_tokens=prompt_tokens + len(content) // 4 * n)
+        )
+
+
+def lognormal_latency(median, sigma=0.5, seed=0):
+    """Latency callable returning lognormal seconds around median (always 0 if median is 0)."""
+    rng = random.Random(seed)
+    if median <= 0:
+        return lambda: 0.0
+    return lambda: rng.lognormvariate(math.log(median), sigma)
+
+
+# Offline stand-in for the Drive feedback backend (upload runs in a worker thread, like the real one)
+class FakeDriveBackend:
+    def __init__(self, latency=lambda: 0.0):
+        self.latency = latency
+        self.uploads = 0
+        self.bytes = 0
+
+    def upload(self, name, data):
+        time.sleep(self.latency())
+        self.uploads += 1
+        self.bytes += len(data)
+
+
+# Minimal Discord objects: just the attributes and coroutines the message pipeline uses
+class FakeUser:
+    def __init__(self, id, bot=False, roles=()):
+        self.id = id
+        self.bot = bot
+        self.roles = [SimpleNamespace(id=role) for role in roles]
+        self.mention = f"<@{id}>"
+
+
+class FakeHistory:
+    def __init__(self, messages, latency):
+        self.messages = messages
+        self.latency = latency
+
+    async def flatten(self):
+        await asyncio.sleep(self.latency())
+        return self.messages
+
+
+class FakeChannel:
+    def __init__(self, id, guild, category_id=None, latency=lambda: 0.0):
+        self.id = id
+        self.guild = guild
+        self.category_id = category_id
+        self.latency = latency  # REST latency (history, fetch_message, send)
+        self.messages = []  # Oldest first
+        self.sent = 0
+
+    def history(self, limit=100, before=None):
+        messages = [message for message in self.messages if before is None or message.id < before.id]
+        return FakeHistory(messages[::-1][:limit], self.latency)
+
+    async def fetch_message(self, message_id):
+        await asyncio.sleep(self.latency())
+        for message in self.messages:
+            if message.id == message_id:
+                return message
+        raise LookupError(f"Unknown message {message_id}")
+
+    async def send(self, content=None, embeds=None, view=None, **options):
+        await asyncio.sleep(self.latency())
+        self.sent += 1
+
+
+class FakeMessage:
+    def __init__(self, id, channel, author, content, reference=None):
+        self.id = id
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.reference = reference  # SimpleNamespace(channel_id, message_id, resolved) for replies
+        self.webhook_id = None
+
+
+class FakeBot:
+    def __init__(self, channels=()):
+        self.user = FakeUser(0, bot=True)
+        self.channels = {channel.id: channel for channel in channels}
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    async def get_context(self, message):
+        # No prefix commands are registered
+        return SimpleNamespace(valid=False)
+
+    async def process_commands(self, message):
+        pass
@@ -0,0 +1,126 @@
+import asyncio
+import glob
+import json
+import os
+import threading
+import time
+from io import BytesIO
+
+
+# Backend that writes uploaded segments to a local directory (stand-in for Drive, e.g. in tests)
+class LocalDirBackend:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def upload(self, name, data):
+        with open(os.path.join(self.directory, name), 'wb') as f:
+            f.write(data)
+
+
+# Backend that uploads each segment as a new file next to the fine-tuning file on Google Drive.
+# The folder ID is looked up once and cached, so an upload is a single request. service may be
+# None until Drive is connected; uploads fail (and segments stay on disk) until it is set.
+class DriveBackend:
+    def __init__(self, service, file_name):
+        self.service = service
+        self.file_name = file_name
+        self.folder_id = None
+        self.folder_known = False
+
+    def _folder(self):
+        if not self.folder_known:
+            results = self.service.files().list(q=f"name='{self.file_name}'", fields="files(id, parents)").execute()
+            items = results.get('files', [])
+            self.folder_id = items[0].get('parents', [None])[0] if items else None
+            self.folder_known = True
+        return self.folder_id
+
+    def upload(self, name, data):
+        if self.service is None:
+            raise ConnectionError("Drive is not connected")
+        from googleapiclient.http import MediaIoBaseUpload
+
+        body = {'name': name}
+        folder_id = self._folder()
+        if folder_id:
+            body['parents'] = [folder_id]
+        media = MediaIoBaseUpload(BytesIO(data), mimetype='text/plain', resumable=True)
+        self.service.files().create(body=body, media_body=media, fields='id').execute()
+
+
+# Durable, append-only sink for fine-tuning feedback. Each submission is appended to a local
+# write-ahead JSONL file; a background task periodically rotates it into a segment and uploads
+# the segment through the backend. Segments are only deleted once uploaded, so anything not yet
+# uploaded (including after a crash or restart) is picked up by the next flush.
+class FeedbackSink:
+    def __init__(self, backend, directory='feedback', prefix='ufohFT', flush_interval=60, max_records=100):
+        self.backend = backend
+        self.directory = directory
+        self.prefix = prefix
+        self.flush_interval = flush_interval
+        self.max_records = max_records
+        self.wal_path = os.path.join(directory, 'wal.jsonl')
+        self.pending = 0  # Records appended since the last rotation
+        self._lock = threading.Lock()
+        self._flushing = asyncio.Lock()  # One flush at a time, so a segment is never uploaded twice
+        self._wake = asyncio.Event()
+        self._task = None
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, record):
+        """Durably append one record to the write-ahead file."""
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            with open(self.wal_path, 'a') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending += 1
+
+    async def submit(self, record):
+        """Append a record without blocking the event loop; uploading happens in the background."""
+        await asyncio.to_thread(self.append, record)
+        if self.pending >= self.max_records:
+            self._wake.set()
+
+    def rotate(self):
+        """Move the write-ahead file into a new segment ready for upload."""
+        with self._lock:
+            if os.path.exists(self.wal_path) and os.path.getsize(self.wal_path) > 0:
+                os.replace(self.wal_path, os.path.join(self.directory, f'segment-{time.time_ns()}.jsonl'))
+            self.pending = 0
+
+    def upload_segments(self):
+        """Upload every segment waiting on disk (oldest first); returns the number uploaded."""
+        uploaded = 0
+        for path in sorted(glob.glob(os.path.join(self.directory, 'segment-*.jsonl'))):
+            with open(path, 'rb') as f:
+                data = f.read()
+            name = os.path.basename(path).replace('segment', self.prefix, 1)
+            self.backend.upload(name, data)
+            os.remove(path)
+            uploaded += 1
+        return uploaded
+
+    async def flush(self):
+        async with self._flushing:
+            await asyncio.to_thread(self.rotate)
+            try:
+                await asyncio.to_thread(self.upload_segments)
+            except Exception as e:
+                # Segments stay on disk and are retried on the next flush
+                print(f"Feedback upload failed ({e}).")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flusher())
+
+    async def _flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
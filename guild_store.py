@@ -0,0 +1,110 @@
+import json
+import sqlite3
+
+from policy import PolicyEngine, DEFAULT_THRESHOLDS
+from routing import RoutingIndex
+
+
+# Configuration of one guild, with its thresholds compiled into a policy and its routing flags into an index
+class GuildConfig:
+    __slots__ = ("guild_id", "thresholds", "policy", "logging", "logschannel", "flags", "routing")
+
+    def __init__(self, guild_id, thresholds, logging, logschannel, flags):
+        self.guild_id = guild_id
+        self.thresholds = thresholds
+        self.policy = PolicyEngine(thresholds)
+        self.logging = logging
+        self.logschannel = logschannel
+        self.flags = flags
+        self.routing = RoutingIndex(flags)
+
+
+# Per-guild configuration store backed by SQLite with a read-through in-memory cache. A guild's
+# row is loaded the first time it is needed; writes go to the database and update the cached
+# config in place, so reads on the message hot path never touch disk.
+class GuildStore:
+    def __init__(self, path='guilds.db', default_logschannel=None):
+        self.default_logschannel = default_logschannel
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS guilds (
+            guild_id INTEGER PRIMARY KEY,
+            thresholds TEXT NOT NULL,
+            logging INTEGER NOT NULL,
+            logschannel INTEGER,
+            flags TEXT NOT NULL
+        )""")
+        self.db.commit()
+        self.cache = {}
+
+    def get(self, guild_id):
+        """Return the config of a guild (defaults if it has never been configured)."""
+        config = self.cache.get(guild_id)
+        if config is None:
+            config = self.cache[guild_id] = self._load(guild_id)
+        return config
+
+    def _load(self, guild_id):
+        row = self.db.execute("SELECT thresholds, logging, logschannel, flags FROM guilds WHERE guild_id = ?",
+                              (guild_id,)).fetchone()
+        if row is None:
+            return GuildConfig(guild_id, dict(DEFAULT_THRESHOLDS), True, self.default_logschannel, {})
+        thresholds, logging, logschannel, flags = row
+        # Thresholds added since the row was written keep their defaults
+        return GuildConfig(guild_id, {**DEFAULT_THRESHOLDS, **json.loads(thresholds)}, bool(logging),
+                           logschannel if logschannel is not None else self.default_logschannel, json.loads(flags))
+
+    def _save(self, config):
+        logschannel = config.logschannel if config.logschannel != self.default_logschannel else None
+        self.db.execute("INSERT OR REPLACE INTO guilds (guild_id, thresholds, logging, logschannel, flags) VALUES (?, ?, ?, ?, ?)",
+                        (config.guild_id, json.dumps(config.thresholds), int(config.logging), logschannel, json.dumps(config.flags)))
+        self.db.commit()
+
+    def set_threshold(self, guild_id, key, value):
+        """Set one threshold; returns False if the key is not a threshold."""
+        config = self.get(guild_id)
+        if key not in config.thresholds:
+            return False
+        config.thresholds[key] = value
+        config.policy.compile(config.thresholds)
+        self._save(config)
+        return True
+
+    def set_all_thresholds(self, guild_id, action, value):
+        """Set every threshold of an action (ban/kick/warn); returns whether any were updated."""
+        config = self.get(guild_id)
+        keys = [key for key in config.thresholds if key.startswith(action)]
+        for key in keys:
+            config.thresholds[key] = value
+        if keys:
+            config.policy.compile(config.thresholds)
+            self._save(config)
+        return bool(keys)
+
+    def set_logging(self, guild_id, enabled, logschannel=None):
+        config = self.get(guild_id)
+        config.logging = enabled
+        if logschannel is not None:
+            config.logschannel = logschannel
+        self._save(config)
+
+    def set_flag(self, guild_id, name, value):
+        """Set a feature flag (any JSON-serializable value)."""
+        config = self.get(guild_id)
+        config.flags[name] = value
+        config.routing = RoutingIndex(config.flags)
+        self._save(config)
+
+    def set_exempt(self, guild_id, kind, item_id, exempt):
+        """Add or remove a role/channel/category ID from the guild's exemptions."""
+        key = {"role": "exempt_roles", "channel": "exempt_channels", "category": "exempt_categories"}[kind]
+        items = set(self.get(guild_id).flags.get(key, []))
+        if exempt:
+            items.add(item_id)
+        else:
+            items.discard(item_id)
+        self.set_flag(guild_id, key, sorted(items))
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,114 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+
+from ratelimit import TokenBucket, is_rate_limit, retry_after
+
+# Entry priorities (lower is delivered first)
+BAN, KICK, WARN, ERROR, BENIGN = range(5)
+PRIORITIES = {"ban": BAN, "kick": KICK, "warn": WARN}
+
+# Discord limits for one message
+MAX_EMBEDS = 10
+MAX_EMBED_CHARS = 6000
+
+
+# Queue and delivery task of one logs channel
+class ChannelQueue:
+    __slots__ = ("entries", "wake", "bucket", "task")
+
+    def __init__(self, rate, burst):
+        self.entries = []  # Heap of (priority, sequence, embed, view)
+        self.wake = asyncio.Event()
+        self.bucket = TokenBucket(rate, burst)
+        self.task = None
+
+
+# Delivers moderation logs in the background so classification never waits on Discord. Each logs
+# channel has its own priority queue (ban > kick > warn > errors > no action) and token bucket
+# (Discord allows about 5 messages per 5 seconds per channel). Consecutive entries without buttons
+# are merged into a single message of up to 10 embeds. When a queue is full, the lowest priority
+# entry is dropped.
+class LogDispatcher:
+    def __init__(self, bot, rate=1.0, burst=5, max_queue=500, observe=None):
+        self.bot = bot
+        self.observe = observe  # Optional callback (seconds) for every message sent
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.channels = {}
+        self.sequence = itertools.count()
+        self.sent = 0
+        self.messages = 0
+        self.dropped = 0
+        self.sampled_out = 0
+
+    def post(self, channel_id, priority, embed, view=None, sample=1.0):
+        """Queue a log entry without waiting. BENIGN entries are kept with probability sample."""
+        if priority == BENIGN and sample < 1.0 and random.random() >= sample:
+            self.sampled_out += 1
+            return
+        queue = self.channels.get(channel_id)
+        if queue is None:
+            queue = self.channels[channel_id] = ChannelQueue(self.rate, self.burst)
+        if queue.task is None or queue.task.done():
+            queue.task = asyncio.create_task(self._deliver(channel_id, queue))
+
+        entry = (priority, next(self.sequence), embed, view)
+        if len(queue.entries) >= self.max_queue:
+            worst = max(queue.entries)
+            if entry > worst:
+                self.dropped += 1
+                return
+            queue.entries.remove(worst)
+            heapq.heapify(queue.entries)
+            self.dropped += 1
+        heapq.heappush(queue.entries, entry)
+        queue.wake.set()
+
+    def depth(self):
+        """Entries waiting across all channels."""
+        return sum(len(queue.entries) for queue in self.channels.values())
+
+    def _next_message(self, queue):
+        # Highest priority entry, plus following button-less entries while they fit in one message
+        entries = [heapq.heappop(queue.entries)]
+        if entries[0][3] is None:
+            size = len(entries[0][2])
+            while queue.entries and len(entries) < MAX_EMBEDS and queue.entries[0][3] is None \
+                    and size + len(queue.entries[0][2]) <= MAX_EMBED_CHARS:
+                entries.append(heapq.heappop(queue.entries))
+                size += len(entries[-1][2])
+        return entries
+
+    async def _deliver(self, channel_id, queue):
+        while True:
+            if not queue.entries:
+                queue.wake.clear()
+                await queue.wake.wait()
+                continue
+            await queue.bucket.acquire()
+            entries = self._next_message(queue)
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                self.dropped += len(entries)
+                continue
+            started = time.perf_counter()
+            try:
+                await channel.send(embeds=[entry[2] for entry in entries], view=entries[0][3])
+            except Exception as e:
+                if is_rate_limit(e):
+                    # Put the entries back and let the whole channel wait
+                    queue.bucket.pause(retry_after(e))
+                    for entry in entries:
+                        heapq.heappush(queue.entries, entry)
+                else:
+                    print(f"Failed to send logs to {channel_id} ({e}).")
+                    self.dropped += len(entries)
+                continue
+            if self.observe is not None:
+                self.observe(time.perf_counter() - started)
+            self.sent += len(entries)
+            self.messages += 1
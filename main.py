@@ -1,277 +1,264 @@
-import re
+import asyncio
 
 # DISCORD INCLUDES
 import nextcord
 from nextcord import Interaction, SlashOption
 from nextcord.ext import commands
-import discord
-
-# GDRIVE INCLUDES (FOR WRITING TO A FILE)
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from googleapiclient.http import MediaIoBaseUpload
-from io import BytesIO
-import os.path
-
-# GPT CALL INCLUDES
-import openai
-from openai import OpenAI
-
-# Level of access to drive (for writing to a file)
-SCOPES = ['https://www.googleapis.com/auth/drive']
-
-# Role used for chat requests
-role = ("Ufoh is a chatbot that applies a numeric grading to an input target message that optionally has up to five "
-        "context messages (messages directly prior to the target) and a message being specifically replied to. "
-        "True/false variables for hate against race, religion, origin, gender, sexuality, age, and disabilities are "
-        "also provided in the output. Supportive range: -5 < 0, Neutral: 0, Hateful range: 0 < 5. The target message is "
-        "specified by starting with 'Message To Evaluate', while the messages previously said by OTHER PEOPLE is under "
-        "CONTEXT ---, where 'Message Being Replied To' is a directly reply. However, note that just because there is "
-        "not a specific message being replied to doesn't mean that the previous messages are not indirectly being "
-        "replied to. Therefore, take the context of the previous messages into account as well. Format the output in "
-        "this way: hate_speech_score: #, target_race: true/false, target_religion: true/false, target_origin: true/false, "
-        "target_gender: true/false, target_sexuality: true/false, target_age: true/false, target_disability: true/false. "
-        "Example input: CONTEXT --- Message n-5: Hey guys Message n-4: Welcome Message n-3: Hii Message n-2: Welcome in "
-        "bro Message n-1: Yessir Message Being Replied To: N/A TARGET --- Message To Evaluate: Shut up! Example output: "
-        "hate_speech_score: 1 target_race: False target_religion: False target_origin: False target_gender: False "
-        "target_sexuality: False target_age: False target_disability: False. Note that hate_speech_score is POSITIVE "
-        "because the more POSITIVE the score, the MORE hateful the message.")
-
-# Login for Google Drive (needs access to a cloud file)
-def service_account_login():
-    """Log in to Google API and return service object."""
-    creds = None
-    # The file token.json stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first time.
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
-
-    return build('drive', 'v3', credentials=creds)
-
-def read_file(service, file_name):
-    """Read file content from Google Drive."""
-    results = service.files().list(q=f"name='{file_name}'", fields="files(id, name)").execute()
-    items = results.get('files', [])
-    if not items:
-        print('No files found.')
-        return None
-    else:
-        file_id = items[0]['id']
-        request = service.files().get_media(fileId=file_id)
-        file = request.execute()
-        print(file)
-
-def write_to_file(service, file_name, content_to_append):
-    """Append content to a file in Google Drive on a new line."""
-    # Locate file
-    results = service.files().list(q=f"name='{file_name}'", fields="files(id, name)").execute()
-    items = results.get('files', [])
-    if not items:
-        print('File not found.')
-        return
-
-    file_id = items[0]['id']
 
-    # Get file contents
-    request = service.files().get_media(fileId=file_id)
-    existing_content = request.execute()
-
-    # Assuming the file content is in a plain text format and can be decoded
-    try:
-        existing_content = existing_content.decode('utf-8')
-    except AttributeError:
-        existing_content = ''
-
-    # For appending to the file
-    new_content = existing_content + '\n' + content_to_append
-
-    # Convert the new combined string to bytes and make a file-like object
-    fh = BytesIO(new_content.encode())
-    media = MediaIoBaseUpload(fh, mimetype='text/plain', resumable=True)
-    # Update the file with the new content
-    service.files().update(fileId=file_id, media_body=media).execute()
-
-# Function to determine if the output matches the desired format
-def is_correct_format(output):
-    required_fields = [
-        "hate_speech_score", "target_race", "target_religion",
-        "target_origin", "target_gender", "target_sexuality",
-        "target_age", "target_disability"
-    ]
-    for field in required_fields:
-        if f"{field}:" not in output:
-            return False
-    return True
-
-def convert_value(value):
-    # Remove any trailing non-numeric characters (like the trailing period in "False.")
-    value = re.sub(r'\W+$', '', value)
-    # Convert to appropriate data type
-    if value.isdigit() or re.match(r'^-?\d+\.?\d*$', value):
-        return float(value)  # Handle integers and floats
-    elif value in ['True', 'False']:
-        return value == 'True'
-    return value
-
-# Fine-tuning buttons
-class AdjustScoreView(discord.ui.View):
-    def __init__(self, author, content, score, race, religion, origin, gender, sexuality, age, disability, msgn1, msgn2, msgn3, msgn4, msgn5, msgr):
-        super().__init__()
-        self.author = author
-        self.content = content
-        self.msgn1 = msgn1
-        self.msgn2 = msgn2
-        self.msgn3 = msgn3
-        self.msgn4 = msgn4
-        self.msgn5 = msgn5
-        self.msgr = msgr
-        self.score = score
-        self.race = race
-        self.religion = religion
-        self.origin = origin
-        self.gender = gender
-        self.sexuality = sexuality
-        self.age = age
-        self.disability = disability
+import importlib
+import os
+
+# GDRIVE INCLUDES (FOR WRITING TO A FILE; the Google client libraries are imported when Drive is connected)
+from drive import service_account_login, DriveAuthError
+
+# GPT CALL INCLUDES (the openai package is imported after start-up, see LazyOpenAI)
+from config import load_settings
+from classifier import ClassificationEngine
+from batching import MicroBatcher
+from recovery import RecoveryStrategy
+from prompts import MODEL, role, training_role, format_input
+from parsing import JSON_INSTRUCTION
+from verdict_cache import VerdictCache
+from near_dup import NearDuplicateIndex
+from context_buffer import ContextBuffer
+from feedback_sink import FeedbackSink, DriveBackend
+from prefilter import Prefilter
+from guild_store import GuildStore
+from log_dispatcher import LogDispatcher
+from reviews import ReviewStore
+from admission import AdmissionControl
+from worker_pool import ClassifierProcessPool
+from metrics import Registry
+from pipeline import MessagePipeline, PipelineMetrics
+
+# Fine-tuning buttons: (action, label, style). Every button's custom_id is "ufoh:<action>:<review ID>", so clicks are
+# routed by on_interaction (see route_review) and keep working after the view has timed out or the bot has restarted.
+REVIEW_BUTTONS = [
+    ("submit", "Submit for Fine-tuning", nextcord.ButtonStyle.primary),
+    ("inc", "Increase Score", nextcord.ButtonStyle.green),
+    ("dec", "Decrease Score", nextcord.ButtonStyle.red),
+    ("t0", "Toggle target_race", nextcord.ButtonStyle.secondary),
+    ("t1", "Toggle target_religion", nextcord.ButtonStyle.secondary),
+    ("t2", "Toggle target_origin", nextcord.ButtonStyle.secondary),
+    ("t3", "Toggle target_gender", nextcord.ButtonStyle.secondary),
+    ("t4", "Toggle target_sexuality", nextcord.ButtonStyle.secondary),
+    ("t5", "Toggle target_age", nextcord.ButtonStyle.secondary),
+    ("t6", "Toggle target_disability", nextcord.ButtonStyle.secondary)
+]
+REVIEW_VIEW_TIMEOUT = 600  # Seconds before the live view is dropped from memory (routing by custom_id continues)
+
+class AdjustScoreView(nextcord.ui.View):
+    def __init__(self, record):
+        super().__init__(timeout=REVIEW_VIEW_TIMEOUT)
+        for action, label, style in REVIEW_BUTTONS:
+            self.add_item(nextcord.ui.Button(label=label, style=style, custom_id=f"ufoh:{action}:{record.id}", disabled=record.submitted))
+
+# Handle a click on a fine-tuning button
+async def handle_review(interaction, action, record_id):
+    record = reviews.get(record_id)
+    if record is None:
+        await interaction.response.send_message("This review is no longer available.", ephemeral=True)
+        return
+    if interaction.user.id != record.author_id:
+        await interaction.response.send_message("You are not authorized to change this score.", ephemeral=True)
+        return
 
     # Submit jsonl formatted user corrected output for fine-tuning
-    @discord.ui.button(label="Submit for Fine-tuning", style=discord.ButtonStyle.primary)
-    async def submit(self, button: discord.ui.Button, interaction: discord.Interaction):
-        if interaction.user != self.author:
-            await interaction.response.send_message("You are not authorized to change this score.", ephemeral=True)
+    if action == "submit":
+        if record.submitted:
+            await interaction.response.send_message("This feedback has already been submitted.", ephemeral=True)
             return
-
+        # Mark the record before the first await so a double-click cannot submit it twice
+        record.submitted = True
+        reviews.update(record)
         # Respond to the interaction first
         await interaction.response.send_message("Your feedback has been provided successfully.", ephemeral=True)
+        await feedback.submit({"messages": [
+            {"role": "system", "content": training_role},
+            {"role": "user", "content": format_input(record.context, record.msgr, record.content)},
+            {"role": "assistant", "content": record.output()}
+        ]})
+        # Disable all buttons (update the message, not the initial response)
+        await interaction.followup.edit_message(interaction.message.id, view=AdjustScoreView(record))
+        return
 
-        input = "CONTEXT --- Message n-5: " + self.msgn5 + " Message n-4: " + self.msgn4 + " Message n-3: " + self.msgn3 + " Message n-2: " + self.msgn2 + " Message n-1: " + self.msgn1 + " Message Being Replied To: " + self.msgr + " TARGET --- Message To Evaluate: " + self.content
-        output = f"hate_speech_score: {self.score} target_race: {self.race} target_religion: {self.religion} target_origin: {self.origin} target_gender: {self.gender} target_sexuality: {self.sexuality} target_age: {self.age} target_disability: {self.disability}"
-        jsonl = "{\"messages\": [{\"role\": \"system\", \"content\": \"" + role + ".\"}, {\"role\": \"user\", \"content\": \"" + input + "\"}, {\"role\": \"assistant\", \"content\": \"" + output + "\"}]}"
-        write_to_file(service, file_name, jsonl)
-
-        # Disable all buttons in this view
-        for item in self.children:
-            if isinstance(item, discord.ui.Button):
-                item.disabled = True
-
-        # Update the message (not the initial response)
-        await interaction.followup.edit_message(interaction.message.id, view=self)
-
-    # Buttons for user correction (increase/decrease hate score or toggle each category true/false)
-    @discord.ui.button(label="Increase Score", style=discord.ButtonStyle.green)
-    async def increase_score(self, button: discord.ui.Button, interaction: discord.Interaction):
-        if interaction.user != self.author:
-            await interaction.response.send_message("You are not authorized to change this score.", ephemeral=True)
-            return
-        self.score += 1  # 
-        await interaction.message.edit(content=f"\nCorrected Model Output: hate_speech_score: {self.score} target_race: {self.race} target_religion: {self.religion} target_origin: {self.origin} target_gender: {self.gender} target_sexuality: {self.sexuality} target_age: {self.age} target_disability: {self.disability}")
-
-    @discord.ui.button(label="Decrease Score", style=discord.ButtonStyle.red)
-    async def decrease_score(self, button: discord.ui.Button, interaction: discord.Interaction):
-        if interaction.user != self.author:
-            await interaction.response.send_message("You are not authorized to change this score.", ephemeral=True)
-            return
-        self.score -= 1  
-        await interaction.message.edit(content=f"\nCorrected Model Output: hate_speech_score: {self.score} target_race: {self.race} target_religion: {self.religion} target_origin: {self.origin} target_gender: {self.gender} target_sexuality: {self.sexuality} target_age: {self.age} target_disability: {self.disability}")
-        
-    @discord.ui.button(label="Toggle target_race", style=discord.ButtonStyle.secondary)
-    async def toggle_race(self, button: discord.ui.Button, interaction: discord.Interaction):
-        if interaction.user != self.author:
-            await interaction.response.send_message("You are not authorized to change this score.", ephemeral=True)
-            return
-        self.race = not self.race
-        await interaction.message.edit(content=f"\nCorrected Model Output: hate_speech_score: {self.score} target_race: {self.race} target_religion: {self.religion} target_origin: {self.origin} target_gender: {self.gender} target_sexuality: {self.sexuality} target_age: {self.age} target_disability: {self.disability}")
-    
-    @discord.ui.button(label="Toggle target_religion", style=discord.ButtonStyle.secondary)
-    async def toggle_religion(self, button: discord.ui.Button, interaction: discord.Interaction):
-        if interaction.user != self.author:
-            await interaction.response.send_message("You are not authorized to change this score.", ephemeral=True)
-            return
-        self.religion = not self.religion
-        await interaction.message.edit(content=f"\nCorrected Model Output: hate_speech_score: {self.score} target_race: {self.race} target_religion: {self.religion} target_origin: {self.origin} target_gender: {self.gender} target_sexuality: {self.sexuality} target_age: {self.age} target_disability: {self.disability}")
-    
-    @discord.ui.button(label="Toggle target_origin", style=discord.ButtonStyle.secondary)
-    async def toggle_origin(self, button: discord.ui.Button, interaction: discord.Interaction):
-        if interaction.user != self.author:
-            await interaction.response.send_message("You are not authorized to change this score.", ephemeral=True)
-            return
-        self.origin = not self.origin
-        await interaction.message.edit(content=f"\nCorrected Model Output: hate_speech_score: {self.score} target_race: {self.race} target_religion: {self.religion} target_origin: {self.origin} target_gender: {self.gender} target_sexuality: {self.sexuality} target_age: {self.age} target_disability: {self.disability}")
-    
-    @discord.ui.button(label="Toggle target_gender", style=discord.ButtonStyle.secondary)
-    async def toggle_gender(self, button: discord.ui.Button, interaction: discord.Interaction):
-        if interaction.user != self.author:
-            await interaction.response.send_message("You are not authorized to change this score.", ephemeral=True)
-            return
-        self.gender = not self.gender
-        await interaction.message.edit(content=f"\nCorrected Model Output: hate_speech_score: {self.score} target_race: {self.race} target_religion: {self.religion} target_origin: {self.origin} target_gender: {self.gender} target_sexuality: {self.sexuality} target_age: {self.age} target_disability: {self.disability}")
-
-    @discord.ui.button(label="Toggle target_sexuality", style=discord.ButtonStyle.secondary)
-    async def toggle_sexuality(self, button: discord.ui.Button, interaction: discord.Interaction):
-        if interaction.user != self.author:
-            await interaction.response.send_message("You are not authorized to change this score.", ephemeral=True)
-            return
-        self.sexuality = not self.sexuality
-        await interaction.message.edit(content=f"\nCorrected Model Output: hate_speech_score: {self.score} target_race: {self.race} target_religion: {self.religion} target_origin: {self.origin} target_gender: {self.gender} target_sexuality: {self.sexuality} target_age: {self.age} target_disability: {self.disability}")
-
-    @discord.ui.button(label="Toggle target_age", style=discord.ButtonStyle.secondary)
-    async def toggle_age(self, button: discord.ui.Button, interaction: discord.Interaction):
-        if interaction.user != self.author:
-            await interaction.response.send_message("You are not authorized to change this score.", ephemeral=True)
-            return
-        self.age = not self.age
-        await interaction.message.edit(content=f"\nCorrected Model Output: hate_speech_score: {self.score} target_race: {self.race} target_religion: {self.religion} target_origin: {self.origin} target_gender: {self.gender} target_sexuality: {self.sexuality} target_age: {self.age} target_disability: {self.disability}")
+    # User correction (increase/decrease hate score or toggle a category true/false)
+    if action == "inc":
+        record.score += 1
+    elif action == "dec":
+        record.score -= 1
+    else:
+        record.toggle(int(action[1:]))
+    reviews.update(record)
+    await interaction.response.edit_message(content=f"\nCorrected Model Output: {record.output()}")
+
+# Settings and secrets from the environment (UFOH_<KEY>), ufoh.json or Colab userdata (see config.py)
+settings = load_settings()
+
+# Initialize OpenAI API (classifier worker processes read the key from the environment too)
+if settings.get('openapikey'):
+    os.environ["OPENAI_API_KEY"] = settings.get('openapikey')
+
+# openai.AsyncOpenAI created on first use, so importing the openai package is not part of start-up
+# (on_ready imports it in a thread before the first message is classified)
+class LazyOpenAI:
+    def __init__(self):
+        self.client = None
+
+    @property
+    def chat(self):
+        if self.client is None:
+            from openai import AsyncOpenAI
+            self.client = AsyncOpenAI()
+        return self.client.chat
+
+client = LazyOpenAI()
+
+# Metrics in the Prometheus text format, served on http://127.0.0.1:METRICS_PORT/metrics once the bot is ready
+# (9100 is left to node_exporter; set UFOH_METRICS_PORT or "metrics_port" in ufoh.json to change it)
+METRICS_PORT = int(settings.get('metrics_port', 9464))
+metrics = Registry()
+pipeline_metrics = PipelineMetrics(metrics)
+
+# Output format requested from the model: "text" (what the fine-tuned model was trained on) or "json" (structured output)
+RESPONSE_FORMAT = "text"
+response_options = {"response_format": {"type": "json_object"}} if RESPONSE_FORMAT == "json" else {}
+
+# Classification requests run on a bounded pool of async workers (never block the gateway)
+system_role = role + (JSON_INSTRUCTION if RESPONSE_FORMAT == "json" else "")
+engine_options = dict(workers=8, max_pending=64, timeout=30.0, **response_options)
+engine = ClassificationEngine(client, MODEL, system_role, observe=pipeline_metrics.observe_completion, **engine_options)
+# Malformed outputs: "n" asks for RECOVERY_CANDIDATES choices per call, "retry" retries once with backoff and jitter
+RECOVERY_MODE = "retry"
+RECOVERY_CANDIDATES = 3
+recovery_options = dict(mode=RECOVERY_MODE, candidates=RECOVERY_CANDIDATES, retries=1)
+recovery = RecoveryStrategy(engine, **recovery_options)
+# Pending targets are packed into one request (up to BATCH_SIZE targets, waiting at most BATCH_WAIT seconds).
+# The fine-tuned model was trained on single items, so batching stays off until evaluate.py shows it follows the
+# "Item N:" format; if enabled, it turns itself off when too many batched items are missing from the output.
+BATCH_SIZE = 1
+BATCH_WAIT = 0.2
+batch_options = dict(max_batch=BATCH_SIZE, max_wait=BATCH_WAIT, json_mode=RESPONSE_FORMAT == "json")
+batcher = MicroBatcher(recovery, **batch_options)
+
+# With CLASSIFIER_PROCESSES > 0, classification (engine, recovery and batching as above) runs in that many worker
+# processes instead of the gateway process, so it scales across cores and a crashed worker is restarted without
+# touching the gateway connection
+CLASSIFIER_PROCESSES = 0
+classifier_pool = ClassifierProcessPool(CLASSIFIER_PROCESSES, MODEL, system_role, engine_options, recovery_options, batch_options,
+                                        observe=pipeline_metrics.observe_completion) if CLASSIFIER_PROCESSES else None
+classifier = classifier_pool or batcher
+
+# Model outputs for repeated messages are reused instead of calling the model again (saved locally across restarts)
+verdicts = VerdictCache(max_entries=10000, ttl=6 * 60 * 60, path='verdicts.json')
+VERDICT_SAVE_INTERVAL = 300  # Seconds between cache saves
+
+# After an exact cache miss, reuse the verdict of a near-duplicate (case, punctuation, leetspeak or a filler word
+# changed) when their similarity is at least NEAR_DUP_THRESHOLD and their context and replied-to messages are similar
+# too. None disables it: keep it off until evaluate.py shows reused verdicts agree with the model's (then try 0.9).
+NEAR_DUP_THRESHOLD = None
+near_duplicates = NearDuplicateIndex(threshold=NEAR_DUP_THRESHOLD, max_entries=5000) if NEAR_DUP_THRESHOLD is not None else None
+
+# Recent messages per channel, kept up to date from gateway events (history() is only fetched for cold channels)
+CONTEXT_SIZE = 5
+recent_messages = ContextBuffer(per_channel=50, max_channels=1000)
+
+# Local pre-filter (train with `python prefilter.py train`): messages scoring below PREFILTER_BENIGN_BELOW are
+# cleared without calling the model. Disabled if the model file does not exist.
+PREFILTER_PATH = 'prefilter.bin'
+PREFILTER_BENIGN_BELOW = 0.05
+prefilter = Prefilter.from_file(PREFILTER_PATH, benign_below=PREFILTER_BENIGN_BELOW)
+
+# GDrive API (connected in the background once the bot is ready, see connect_drive)
+file_name = settings.get('drive_file', 'ufohFT.txt')  # Update with filename to store jsonl formatted user-corrected outputs
+drive_backend = DriveBackend(None, file_name)
+
+# User-corrected outputs are appended to a local write-ahead file and uploaded to Drive in batches
+# (as new segment files next to file_name) by a background task. Until Drive is connected they stay queued locally.
+feedback = FeedbackSink(drive_backend, directory='feedback', flush_interval=60, max_records=100)
+DRIVE_RETRY_MAX = 600  # Longest wait in seconds between Drive connection attempts
+
+# Only the events the pipeline uses: guilds (channels, roles), guild messages (and their edits/deletes) and message content
+intents = nextcord.Intents.none()
+intents.guilds = True
+intents.guild_messages = True
+intents.message_content = True
+
+# SHARDED runs the gateway as SHARD_COUNT shards (None: the count Discord recommends) on one connection manager
+SHARDED = False
+SHARD_COUNT = None
+if SHARDED:
+    bot = commands.AutoShardedBot(command_prefix="!", intents=intents, shard_count=SHARD_COUNT)
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents)
+
+# Periodically save the verdict cache so a restart does not start cold. The snapshot is taken on the event loop
+# (which is what updates the cache); only the JSON encoding and the file write run in a thread.
+async def save_verdicts():
+    while True:
+        await asyncio.sleep(VERDICT_SAVE_INTERVAL)
+        try:
+            data = verdicts.snapshot()
+            await asyncio.to_thread(verdicts.save, None, data)
+        except Exception as e:
+            print(f"Could not save verdict cache ({e}).")
 
-    @discord.ui.button(label="Toggle target_disability", style=discord.ButtonStyle.secondary)
-    async def toggle_disability(self, button: discord.ui.Button, interaction: discord.Interaction):
-        if interaction.user != self.author:
-            await interaction.response.send_message("You are not authorized to change this score.", ephemeral=True)
+# Connect to Drive without holding up start-up, retrying with backoff while it is unreachable
+async def connect_drive():
+    delay = 5
+    while drive_backend.service is None:
+        try:
+            drive_backend.service = await asyncio.to_thread(service_account_login)
+        except DriveAuthError as e:
+            print(f"Feedback stays in feedback/ until Drive is authorized ({e}).")
             return
-        self.disability = not self.disability
-        await interaction.message.edit(content=f"\nCorrected Model Output: hate_speech_score: {self.score} target_race: {self.race} target_religion: {self.religion} target_origin: {self.origin} target_gender: {self.gender} target_sexuality: {self.sexuality} target_age: {self.age} target_disability: {self.disability}")
-
-# Initialize OpenAI API
-os.environ["OPENAI_API_KEY"] = userdata.get('openapikey')
-client = OpenAI()
-
-# GDrive API
-service = service_account_login()
-file_name = 'ufohFT.txt'  # Update with filename to store jsonl formatted user-corrected outputs
-
-intents = nextcord.Intents.default()
-intents = nextcord.Intents().all()
-bot = commands.Bot(command_prefix="!", intents=intents)
-
-# User input thresholds, if the score is above the threshold for a specific one, do something to the user. Priority: ban > kick > warn
-# Dictionary to hold thresholds
-thresholds = {
-    'banhsth': 2, 'banraceth': 2, 'banreligionth': 2, 'banoriginth': 2,
-    'bangenderth': 2, 'bansexth': 2, 'banageth': 2, 'bandisth': 2,
-    'kickhsth': 1, 'kickraceth': 1, 'kickreligionth': 1, 'kickoriginth': 1,
-    'kickgenderth': 1, 'kicksexth': 1, 'kickageth': 1, 'kickdisth': 1,
-    'warnhsth': 0, 'warnraceth': 0, 'warnreligionth': 0, 'warnoriginth': 0,
-    'warngenderth': 0, 'warnsexth': 0, 'warnageth': 0, 'warndisth': 0
-}
+        except Exception as e:
+            print(f"Could not connect to Drive ({e}), retrying in {delay}s.")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, DRIVE_RETRY_MAX)
+    print("Connected to Drive.")
+    # Upload whatever was queued while Drive was unavailable
+    await feedback.flush()
 
 @bot.event
 async def on_ready():
+    first_ready = not hasattr(bot, 'verdict_saver')
+    if first_ready:
+        bot.verdict_saver = bot.loop.create_task(save_verdicts())
+        bot.drive_connector = bot.loop.create_task(connect_drive())
+    if classifier_pool is not None:
+        await classifier_pool.start()
+    else:
+        engine.start()
+    feedback.start()
+    reviews.start()
+    try:
+        await metrics.serve(port=METRICS_PORT)
+    except OSError as e:
+        print(f"Could not serve metrics on port {METRICS_PORT} ({e}).")
+    if first_ready:
+        # Import the openai package off the event loop before the first classification needs it
+        await asyncio.to_thread(importlib.import_module, 'openai')
     print(f"{bot.user.name} is ready!")
 
-# Enable/disable logs
-logging = True
-logschannel = userdata.get('logschannel')
+# Review records behind the fine-tuning buttons (most recent ones cached in memory, the rest in SQLite, written in the background)
+reviews = ReviewStore('reviews.db', max_cached=1000, max_rows=100000)
+
+# Route fine-tuning button clicks by custom_id (works for messages sent before a restart)
+@bot.listen("on_interaction")
+async def route_review(interaction):
+    if interaction.type != nextcord.InteractionType.component:
+        return
+    custom_id = (interaction.data or {}).get("custom_id", "")
+    if custom_id.startswith("ufoh:"):
+        _, action, record_id = custom_id.split(":")
+        await handle_review(interaction, action, int(record_id))
+
+# Per-guild configuration (user input thresholds, logs channel, feature flags), persisted in SQLite and cached in memory.
+# If the score is above the threshold for a specific one, do something to the user. Priority: ban > kick > warn
+# Guilds without their own logs channel use the default one.
+logschannel = settings.get('logschannel')
+guilds = GuildStore('guilds.db', default_logschannel=int(logschannel) if logschannel else None)
 
 # Allow administrators to configure specific moderation thresholds (what severity of hate speech determines what action)
 @bot.slash_command(description="Set specific moderation thresholds (default: ban = 3, kick = 2, warn = 1)")
@@ -299,8 +286,7 @@ async def setth(
         await interaction.response.send_message("You are not authorized to run this command.", ephemeral=True)
     else:
         # Set the new threshold
-        if threshold_type in thresholds:
-            thresholds[threshold_type] = value
+        if guilds.set_threshold(interaction.guild_id, threshold_type, value):
             await interaction.response.send_message(f"Threshold {threshold_type} has been set to {value}.")
         else:
             await interaction.response.send_message("Invalid threshold type.", ephemeral=True)
@@ -327,217 +313,258 @@ async def setallth(
     else:
         if threshold_type in ['ban', 'kick', 'warn']:
             # Update all matching thresholds for the generalized type
-            updated = False
-            for key in list(thresholds.keys()):
-                if key.startswith(threshold_type):
-                    thresholds[key] = value
-                    updated = True
-            if updated:
+            if guilds.set_all_thresholds(interaction.guild_id, threshold_type, value):
                 await interaction.response.send_message(f"All {threshold_type} thresholds have been set to {value}.")
             else:
                 await interaction.response.send_message(f"No thresholds updated for {threshold_type}.", ephemeral=True)
         else:
             await interaction.response.send_message("Invalid threshold type.", ephemeral=True)
 
+# Allow administrators to enable/disable logs and choose the logs channel
+@bot.slash_command(description="Enable or disable moderation logs and set the logs channel")
+async def setlogs(
+    interaction: Interaction,
+    enabled: bool = SlashOption(
+        name="enabled",
+        description="Whether moderation results are logged",
+        required=True
+    ),
+    channel: nextcord.TextChannel = SlashOption(
+        name="channel",
+        description="The channel to send logs to",
+        required=False
+    )
+):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You are not authorized to run this command.", ephemeral=True)
+    elif enabled and channel is None and guilds.get(interaction.guild_id).logschannel is None:
+        await interaction.response.send_message("Choose a channel to send logs to.", ephemeral=True)
+    else:
+        guilds.set_logging(interaction.guild_id, enabled, channel.id if channel else None)
+        config = guilds.get(interaction.guild_id)
+        await interaction.response.send_message(f"Logs are {'enabled' if enabled else 'disabled'} (channel: <#{config.logschannel}>).")
+
+# Allow administrators to sample or suppress "no action taken" log entries
+@bot.slash_command(description="Set the share of 'no action taken' entries that are logged (0 to 1, default 1)")
+async def setbenignlogs(
+    interaction: Interaction,
+    rate: float = SlashOption(
+        name="rate",
+        description="Share of benign entries to log (0 = none, 1 = all)",
+        required=True,
+        min_value=0,
+        max_value=1
+    )
+):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You are not authorized to run this command.", ephemeral=True)
+    else:
+        guilds.set_flag(interaction.guild_id, 'benign_log_sample', rate)
+        await interaction.response.send_message(f"{rate:.0%} of 'no action taken' entries will be logged.")
+
+# Allow administrators to exempt roles, channels and categories from moderation
+@bot.slash_command(description="Exempt a role, channel or category from moderation (or remove the exemption)")
+async def exempt(
+    interaction: Interaction,
+    exempt: bool = SlashOption(
+        name="exempt",
+        description="Whether to exempt (true) or moderate again (false)",
+        required=True
+    ),
+    role: nextcord.Role = SlashOption(
+        name="role",
+        description="The role to exempt",
+        required=False
+    ),
+    channel: nextcord.abc.GuildChannel = SlashOption(
+        name="channel",
+        description="The channel or category to exempt",
+        required=False
+    )
+):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You are not authorized to run this command.", ephemeral=True)
+    elif role is None and channel is None:
+        await interaction.response.send_message("Choose a role, a channel or a category.", ephemeral=True)
+    else:
+        changed = []
+        if role is not None:
+            guilds.set_exempt(interaction.guild_id, 'role', role.id, exempt)
+            changed.append(role.mention)
+        if channel is not None:
+            kind = 'category' if isinstance(channel, nextcord.CategoryChannel) else 'channel'
+            guilds.set_exempt(interaction.guild_id, kind, channel.id, exempt)
+            changed.append(channel.mention)
+        await interaction.response.send_message(f"{' and '.join(changed)} {'will not' if exempt else 'will'} be moderated.")
+
+# Allow administrators to configure which other messages are skipped before classification
+@bot.slash_command(description="Configure which messages are skipped (bots, webhooks, short messages, commands)")
+async def setrouting(
+    interaction: Interaction,
+    ignore_bots: bool = SlashOption(
+        name="ignore_bots",
+        description="Skip messages from other bots (default: true)",
+        required=False
+    ),
+    ignore_webhooks: bool = SlashOption(
+        name="ignore_webhooks",
+        description="Skip messages sent by webhooks (default: true)",
+        required=False
+    ),
+    min_length: int = SlashOption(
+        name="min_length",
+        description="Skip messages shorter than this many characters (default: 1)",
+        required=False,
+        min_value=0
+    ),
+    command_prefixes: str = SlashOption(
+        name="command_prefixes",
+        description="Space-separated prefixes of registered bot commands to skip (default: none)",
+        required=False
+    )
+):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You are not authorized to run this command.", ephemeral=True)
+    else:
+        settings = {'ignore_bots': ignore_bots, 'ignore_webhooks': ignore_webhooks, 'min_length': min_length,
+                    'command_prefixes': command_prefixes.split() if command_prefixes is not None else None}
+        for name, value in settings.items():
+            if value is not None:
+                guilds.set_flag(interaction.guild_id, name, value)
+        routing = guilds.get(interaction.guild_id).routing
+        await interaction.response.send_message(
+            f"Ignore bots: {routing.ignore_bots}\nIgnore webhooks: {routing.ignore_webhooks}\n"
+            f"Minimum length: {routing.min_length}\nCommand prefixes: {' '.join(routing.command_prefixes) or 'none'}")
+
+# Show how many messages were skipped before classification, by reason
+@bot.slash_command(description="Show how many messages were skipped before classification")
+async def skipstats(interaction: Interaction):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You are not authorized to run this command.", ephemeral=True)
+    else:
+        counts = "\n".join(f"{reason}: {count}" for reason, count in pipeline_metrics.skipped.most_common()) or "No messages skipped."
+        await interaction.response.send_message(counts, ephemeral=True)
+
+# Show verdict cache statistics (hit rate, evictions, memory use)
+@bot.slash_command(description="Show verdict cache statistics")
+async def cachestats(interaction: Interaction):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You are not authorized to run this command.", ephemeral=True)
+    else:
+        stats = verdicts.stats()
+        await interaction.response.send_message(
+            f"Entries: {stats['entries']}\nHit rate: {stats['hit_rate']:.1%} ({stats['hits']} hits, {stats['fallback_hits']} "
+            f"target-only hits, {stats['misses']} misses)\nEvictions: {stats['evictions']}\nMemory: {stats['memory_bytes'] / 1024:.1f} KiB"
+            + (f"\nNear-duplicates: {near_duplicates.stats()['entries']} entries, {near_duplicates.stats()['hit_rate']:.1%} hit rate "
+               f"({near_duplicates.hits} hits)" if near_duplicates is not None else ""),
+            ephemeral=True)
+
+# Keep the per-channel context buffer in sync with edits and deletes
+@bot.event
+async def on_raw_message_edit(payload):
+    if 'content' in payload.data:
+        recent_messages.edit(payload.channel_id, payload.message_id, payload.data['content'])
+
+@bot.event
+async def on_raw_message_delete(payload):
+    recent_messages.delete(payload.channel_id, payload.message_id)
+
+@bot.event
+async def on_raw_bulk_message_delete(payload):
+    for message_id in payload.message_ids:
+        recent_messages.delete(payload.channel_id, message_id)
+
+# Show how often the pre-filter escalates messages to the model
+@bot.slash_command(description="Show pre-filter statistics")
+async def prefilterstats(interaction: Interaction):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You are not authorized to run this command.", ephemeral=True)
+    elif prefilter is None:
+        await interaction.response.send_message("The pre-filter is disabled.", ephemeral=True)
+    else:
+        await interaction.response.send_message(
+            f"Cleared locally: {prefilter.cleared}\nEscalated to the model: {prefilter.escalated} "
+            f"({prefilter.escalation_rate():.1%})\nBenign cut-off: {prefilter.benign_below}", ephemeral=True)
+
+# Admission control in front of the classifier: messages that need a model call (no cached, near-duplicate or
+# pre-filter verdict) are merged into one evaluation unit per burst from one author in one channel, and each unit
+# takes a token from its user, channel and guild buckets
+# (bounds model calls per guild during a raid). A unit waits up to BUDGET_MAX_DELAY seconds for its tokens and is
+# logged for manual review if it is still over budget. Authors with an action in the last VIOLATION_TTL seconds
+# are evaluated immediately.
+VIOLATION_TTL = 600
+BUDGET_MAX_DELAY = 30
+admission = AdmissionControl(user_rate=0.2, user_burst=5, channel_rate=1.0, channel_burst=10, guild_rate=2.0, guild_burst=20,
+                             debounce=1.0, max_merge=5, max_delay=BUDGET_MAX_DELAY, violation_ttl=VIOLATION_TTL)
+
+# Show how many messages admission control merged, fast-pathed, delayed or left for manual review
+@bot.slash_command(description="Show admission control statistics")
+async def admissionstats(interaction: Interaction):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("You are not authorized to run this command.", ephemeral=True)
+    else:
+        stats = admission.stats()
+        rejected = stats['rejected']
+        await interaction.response.send_message(
+            f"Evaluated: {stats['admitted']} ({stats['fast_path']} fast-pathed, {stats['delayed']} delayed by the budget)\n"
+            f"Merged into bursts: {stats['merged']}\nLogged for manual review (over budget): {rejected['user']} user, "
+            f"{rejected['channel']} channel, {rejected['guild']} guild", ephemeral=True)
+
+# Moderation logs are queued per logs channel and delivered in the background (ban > kick > warn > errors > no action)
+logs = LogDispatcher(bot, rate=1.0, burst=5, max_queue=500, observe=lambda seconds: pipeline_metrics.stage_seconds.observe(seconds, "log_send"))
+
+# Embed colours by log priority
+LOG_COLOURS = [nextcord.Colour.dark_red(), nextcord.Colour.red(), nextcord.Colour.orange(), nextcord.Colour.light_grey(), nextcord.Colour.green()]
+
+# Counters and queue depths the pipeline already keeps, read when metrics are scraped
+def recovery_counters():
+    # Recovery totals of this process plus those reported by the classifier worker processes
+    counters = recovery.counters()
+    if classifier_pool is not None:
+        counters = {name: value + classifier_pool.recovery_counters[name] for name, value in counters.items()}
+    return counters
+
+metrics.collected_counter("ufoh_model_outputs_total", "Verdicts requested from the model (batched items count individually)",
+                          lambda: recovery_counters()["outputs"])
+metrics.collected_counter("ufoh_format_failures_total", "Model outputs in an unexpected format",
+                          lambda: recovery_counters()["format_failures"])
+metrics.collected_counter("ufoh_recoveries_total", "Malformed outputs by recovery result", lambda: {
+    ("recovered",): recovery_counters()["recovered"], ("unrecovered",): recovery_counters()["unrecovered"]}, labels=("result",))
+metrics.collected_counter("ufoh_recovery_seconds_total", "Time spent recovering malformed outputs that were recovered",
+                          lambda: recovery_counters()["recovery_time"])
+metrics.collected_counter("ufoh_classifier_restarts_total", "Classifier worker processes restarted after exiting",
+                          lambda: classifier_pool.restarts if classifier_pool else 0)
+metrics.collected_counter("ufoh_cache_lookups_total", "Verdict cache lookups by result", lambda: {
+    ("hit",): verdicts.hits, ("fallback_hit",): verdicts.fallback_hits, ("miss",): verdicts.misses}, labels=("result",))
+metrics.collected_counter("ufoh_near_duplicate_lookups_total", "Near-duplicate lookups after an exact cache miss", lambda: {
+    ("hit",): near_duplicates.hits, ("miss",): near_duplicates.misses} if near_duplicates is not None else {}, labels=("result",))
+metrics.collected_counter("ufoh_admission_total", "Admission control decisions", lambda: {
+    ("admitted",): admission.admitted, ("merged",): admission.merged, ("fast_path",): admission.fast_path, ("delayed",): admission.delayed,
+    **{("rejected_" + name,): count for name, count in admission.rejected.items()}}, labels=("result",))
+metrics.collected_counter("ufoh_log_entries_total", "Log entries by outcome", lambda: {
+    ("sent",): logs.sent, ("dropped",): logs.dropped, ("sampled_out",): logs.sampled_out}, labels=("result",))
+metrics.gauge("ufoh_queue_depth", "Items waiting in each queue", lambda: {
+    ("classifier",): classifier_pool.pending() if classifier_pool else engine.pending(), ("batch",): len(batcher.pending), ("logs",): logs.depth(),
+    ("feedback",): feedback.pending}, labels=("queue",))
+metrics.gauge("ufoh_verdict_cache_entries", "Entries in the verdict cache", lambda: len(verdicts.entries))
+
+# Queue an entry for the guild's logs channel (if logs are enabled); never waits on Discord
+def post_log(config, priority, content, view=None):
+    if config.logging and config.logschannel is not None:
+        embed = nextcord.Embed(description=content[:4096], colour=LOG_COLOURS[priority])
+        logs.post(config.logschannel, priority, embed, view, sample=config.flags.get('benign_log_sample', 1.0))
+
+# Every message goes through the moderation pipeline (see pipeline.py)
+pipeline = MessagePipeline(bot, guilds, admission, recent_messages, verdicts, prefilter, classifier, reviews, post_log,
+                           AdjustScoreView, pipeline_metrics, context_size=CONTEXT_SIZE, near_duplicates=near_duplicates)
+
 @bot.event
 async def on_message(target):
-    # Ignore messages from the bot itself
-    if target.author == bot.user:
-        return
-    
-    # Variable to hold the content of the replied-to message, if it exists
-    msgr = "N/A"
-
-    # Check if the current message is a reply to another message
-    if target.reference and target.reference.resolved:
-        # If the reference is resolved, access the content directly
-        msgr = target.reference.resolved.content
-    elif target.reference:
-        # If the reference exists but is not resolved, fetch the message
-        try:
-            original_msg = await target.channel.fetch_message(target.reference.message_id)
-            msgr = original_msg.content
-        except Exception as e:
-            msgr = "N/A"
-
-    if msgr == "":
-        msgr == "N/A"
-    
-    # Check and fetch the last five messages before the current one
-    history = await target.channel.history(limit=5, before=target).flatten()
-    # This will store messages with messages[0] being the most recent one before the target message
-
-    # Assign each message to a variable if they exist
-    msgn1 = history[0].content if len(history) > 0 else "N/A"
-    msgn2 = history[1].content if len(history) > 1 else "N/A"
-    msgn3 = history[2].content if len(history) > 2 else "N/A"
-    msgn4 = history[3].content if len(history) > 3 else "N/A"
-    msgn5 = history[4].content if len(history) > 4 else "N/A"
-
-    input = "CONTEXT --- Message n-5:" + msgn5 + "Message n-4:" + msgn4 + "Message n-3:" + msgn3 + "Message n-2:" + msgn2 + "Message n-1:" + msgn1 + "Message Being Replied To:" + msgr + "TARGET --- Message To Evaluate: " + target.content
-
-    # Call the OpenAI API to analyze the message
-    completion = client.chat.completions.create(
-    model="ft:gpt-3.5-turbo-0125:personal:ufoh-v3:9ETnxurq",
-    messages=[
-        {"role": "system", "content": role},
-        {"role": "user", "content": input}
-        ]
-    )
-    
-    # MODERATION POLICY
-    ai_output = str(completion.choices[0].message)
-
-    # Try to find a valid output format (5 times max)
-    valid_output_found = is_correct_format(ai_output)
-    index = 0
-    while not valid_output_found and index < min(5, len(completion.choices)):
-        ai_output = str(completion.choices[index].message)
-        valid_output_found = is_correct_format(ai_output)
-        index += 1
-
-    # If no valid output is found, send error and terminate
-    if not valid_output_found:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"Model failed to parse message (no valid output).")
-        return
-    
-    # Extract the content part of the string
+    await pipeline.handle(target)
+
+if __name__ == "__main__":
     try:
-        # Attempt to parse the content string from ai_output
-        content_str = ai_output.split("content='")[1].split("', role=")[0]
-    except IndexError:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"Model failed to parse message (content extraction failed)")
-        return
-    
-    # Assign each parsed keyword to its value
-    # Using the updated regex to extract key-value pairs
-    matches = re.finditer(r'(\w+):\s*([-\w.]+)', content_str)
-    parsed_data = {match.group(1): match.group(2) for match in matches}
-
-    # Apply conversion to each item in the dictionary
-    converted_data = {k: convert_value(v) for k, v in parsed_data.items()}
-    
-    # Initialize values
-    ai_hate_speech_score = converted_data['hate_speech_score']
-    ai_target_race = converted_data['target_race']
-    ai_target_religion = converted_data['target_religion']
-    ai_target_origin = converted_data['target_origin']
-    ai_target_gender = converted_data['target_gender']
-    ai_target_sexuality = converted_data['target_sexuality']
-    ai_target_age = converted_data['target_age']
-    ai_target_disability = converted_data['target_disability']
-    
-    # Ban/kick/warn actions disabled for testing purposes
-    if ai_hate_speech_score <= 0:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\nNo action was taken (hate_speech_score <= 0).")
-        return
-    if ai_hate_speech_score > thresholds['banraceth'] and ai_target_race == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was banned as the target_race threshold ({thresholds['banraceth']}) for bans was exceeded ({ai_hate_speech_score})")
-        #await message.author.ban(reason="Racism")
-    elif ai_hate_speech_score > thresholds['banreligionth'] and ai_target_religion == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was banned as the target_religion threshold ({thresholds['banreligionth']}) for bans was exceeded ({ai_hate_speech_score})")
-        #await message.author.ban(reason="Religious discrimination")
-    elif ai_hate_speech_score > thresholds['banoriginth'] and ai_target_origin == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was banned as the target_origin threshold ({thresholds['banoriginth']}) for bans was exceeded ({ai_hate_speech_score})")
-        #await message.author.ban(reason="Ethnicity discrimination")
-    elif ai_hate_speech_score > thresholds['bangenderth'] and ai_target_gender == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was banned as the target_gender threshold ({thresholds['bangenderth']}) for bans was exceeded ({ai_hate_speech_score})")
-        #await message.author.ban(reason="Sexism")
-    elif ai_hate_speech_score > thresholds['bansexth'] and ai_target_sexuality == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was banned as the target_sexuality threshold ({thresholds['bansexth']}) for bans was exceeded ({ai_hate_speech_score})")
-        #await message.author.ban(reason="Homophobia/Transphobia")
-    elif ai_hate_speech_score > thresholds['banageth'] and ai_target_age == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was banned as the target_age threshold ({thresholds['banageth']}) for bans was exceeded ({ai_hate_speech_score})")
-        #await message.author.ban(reason="Ageism")
-    elif ai_hate_speech_score > thresholds['bandisth'] and ai_target_disability == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was banned as the target_disability threshold ({thresholds['bandisth']}) for bans was exceeded ({ai_hate_speech_score})")
-        #await message.author.ban(reason="Ableism")
-    elif ai_hate_speech_score > thresholds['banhsth']:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was banned as the general hate speech threshold ({thresholds['banhsth']}) for bans was exceeded ({ai_hate_speech_score})")
-        #await message.author.ban(reason="General hate speech")
-    elif ai_hate_speech_score > thresholds['kickraceth'] and ai_target_race == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was kicked as the target_race threshold ({thresholds['kickraceth']}) for kicks was exceeded ({ai_hate_speech_score})")
-        #await message.author.kick(reason="Racism")
-    elif ai_hate_speech_score > thresholds['kickreligionth'] and ai_target_religion == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was kicked as the target_religion threshold ({thresholds['kickreligionth']}) for kicks was exceeded ({ai_hate_speech_score})")
-        #await message.author.kick(reason="Religious discrimination")
-    elif ai_hate_speech_score > thresholds['kickoriginth'] and ai_target_origin == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was kicked as the target_origin threshold ({thresholds['kickoriginth']}) for kicks was exceeded ({ai_hate_speech_score})")
-        #await message.author.kick(reason="Ethnicity discrimination")
-    elif ai_hate_speech_score > thresholds['kickgenderth'] and ai_target_gender == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was kicked as the target_gender threshold ({thresholds['kickgenderth']}) for kicks was exceeded ({ai_hate_speech_score})")
-        #await message.author.kick(reason="Sexism")
-    elif ai_hate_speech_score > thresholds['kicksexth'] and ai_target_sexuality == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was kicked as the target_sexuality threshold ({thresholds['kicksexth']}) for kicks was exceeded ({ai_hate_speech_score})")
-        #await message.author.kick(reason="Homophobia/Transphobia")
-    elif ai_hate_speech_score > thresholds['kickageth'] and ai_target_age == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was kicked as the target_age threshold ({thresholds['kickageth']}) for kicks was exceeded ({ai_hate_speech_score})")
-        #await message.author.kick(reason="Ageism")
-    elif ai_hate_speech_score > thresholds['kickdisth'] and ai_target_disability == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was kicked as the target_disability threshold ({thresholds['kickdisth']}) for kicks was exceeded ({ai_hate_speech_score})")
-        #await message.author.kick(reason="Ableism")
-    elif ai_hate_speech_score > thresholds['kickhsth']:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was kicked as the general hate speech threshold ({thresholds['kickhsth']}) for kicks was exceeded ({ai_hate_speech_score})")
-        #await message.author.kick(reason="General hate speech")
-    elif ai_hate_speech_score > thresholds['warnraceth'] and ai_target_race == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was warned as the target_race threshold ({thresholds['warnraceth']}) for warns was exceeded ({ai_hate_speech_score})")
-        #await message.author.warn(reason="Racism")
-    elif ai_hate_speech_score > thresholds['warnreligionth'] and ai_target_religion == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was warned as the target_religion threshold ({thresholds['warnreligionth']}) for warns was exceeded ({ai_hate_speech_score})")
-        #await message.author.warn(reason="Religious discrimination")
-    elif ai_hate_speech_score > thresholds['warnoriginth'] and ai_target_origin == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was warned as the target_origin threshold ({thresholds['warnoriginth']}) for warns was exceeded ({ai_hate_speech_score})")
-        #await message.author.warn(reason="Ethnicity discrimination")
-    elif ai_hate_speech_score > thresholds['warngenderth'] and ai_target_gender == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was warned as the target_gender threshold ({thresholds['warngenderth']}) for warns was exceeded ({ai_hate_speech_score})")
-        #await message.author.warn(reason="Sexism")
-    elif ai_hate_speech_score > thresholds['warnsexth'] and ai_target_sexuality == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was warned as the target_sexuality threshold ({thresholds['warnsexth']}) for warns was exceeded ({ai_hate_speech_score})")
-        #await message.author.warn(reason="Homophobia/Transphobia")
-    elif ai_hate_speech_score > thresholds['warnageth'] and ai_target_age == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was warned as the target_age threshold ({thresholds['warnageth']}) for warns was exceeded ({ai_hate_speech_score})")
-        #await message.author.warn(reason="Ageism")
-    elif ai_hate_speech_score > thresholds['warndisth'] and ai_target_disability == True:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was warned as the target_disability threshold ({thresholds['warndisth']}) for warns was exceeded ({ai_hate_speech_score})")
-        #await message.author.warn(reason="Ableism")
-    elif ai_hate_speech_score > thresholds['warnhsth']:
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\n{target.author.mention} was warned as the general hate speech threshold ({thresholds['warnhsth']}) for warns was exceeded ({ai_hate_speech_score})")
-        #await message.author.warn(reason="General hate speech")
-    else: # debug
-        log_channel = bot.get_channel(logschannel)
-        await log_channel.send(f"User: {target.author.mention}\n\nMessage: {target.content}\n\nModel Output: {content_str}\n\nNo action was taken. (Hate speech score less than lowest threshold)")
-
-    # TAKE USER CORRECTION
-    view = AdjustScoreView(target.author, target.content, ai_hate_speech_score, ai_target_race, ai_target_religion, ai_target_origin, ai_target_gender, ai_target_sexuality, ai_target_age, ai_target_disability, msgn1, msgn2, msgn3, msgn4, msgn5, msgr)
-    await log_channel.send(f"Fine-tuning Options", view=view)
-
-    await bot.process_commands(target)  # To allow other bot commands to work
-
-bot.run(userdata.get('botkey'))
+        bot.run(settings.require('botkey'))
+    finally:
+        # Write the review records still queued in memory
+        reviews.close()
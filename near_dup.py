@@ -0,0 +1,156 @@
+import random
+import re
+import time
+import zlib
+from collections import Counter, OrderedDict
+
+# Leetspeak and look-alike characters mapped to the letters they stand for
+LEET = str.maketrans({"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b", "@": "a", "$": "s",
+                      "!": "i", "|": "l", "+": "t"})
+NON_WORD = re.compile(r"[^a-z0-9]+")
+REPEATS = re.compile(r"(.)\1{2,}")
+TRAILING_BANGS = re.compile(r"!+(?=\s|$)")  # "!" only stands for "i" inside a word ("sh!t")
+
+# Words a near-duplicate may add or drop (articles, fillers, intensifiers). Anything else, negations
+# ("not", "never", "don t") and content words ("love"/"hate") included, makes two messages different.
+FILLER_WORDS = frozenset("a an the is are was am so very really just too lol lmao haha pls please um uh oh ok okay "
+                         "like literally".split())
+
+def normalize(text):
+    """Lowercase, undo leetspeak, drop punctuation and squeeze repeated letters ("H4TE y0u!!" -> "hate you", "sooo" -> "soo")."""
+    text = TRAILING_BANGS.sub(" ", text.lower()).translate(LEET)
+    text = NON_WORD.sub(" ", text)
+    return REPEATS.sub(r"\1\1", " ".join(text.split()))
+
+def shingles(text, size=3):
+    """Character n-grams of a normalized text (word boundaries included)."""
+    return {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+
+
+# Entry of the near-duplicate index
+class Entry:
+    __slots__ = ("signature", "words", "context", "reply", "output", "expires", "bands")
+
+    def __init__(self, signature, words, context, reply, output, expires, bands):
+        self.signature = signature
+        self.words = words
+        self.context = context
+        self.reply = reply
+        self.output = output
+        self.expires = expires
+        self.bands = bands
+
+
+# Near-duplicate lookup for model verdicts, consulted after an exact cache miss. Targets are
+# normalized (case, leetspeak, punctuation, repeated letters) and summarized by a MinHash signature
+# of their character trigrams; locality-sensitive hashing over bands of the signature finds
+# candidates in O(bands), and a candidate is reused when its estimated Jaccard similarity is at
+# least threshold, their words differ by FILLER_WORDS alone (trigram similarity cannot tell an
+# inserted "not" or a swapped "love"/"hate" from noise), and its context agrees: the five context
+# messages (taken together) and the replied-to message must each be absent in both, or similar by
+# at least context_threshold.
+# The index holds at most max_entries verdicts (oldest evicted first), each for at most ttl seconds.
+class NearDuplicateIndex:
+    def __init__(self, threshold=0.9, context_threshold=0.5, num_perm=32, bands=8, min_length=8, max_entries=5000,
+                 ttl=6 * 60 * 60, max_candidates=32, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        rng = random.Random(seed)
+        self.masks = [rng.getrandbits(32) for _ in range(num_perm)]  # One hash function per mask (crc32 XOR mask)
+        self.threshold = threshold
+        self.context_threshold = context_threshold
+        self.rows = num_perm // bands
+        self.bands = bands
+        self.min_length = min_length
+        self.max_candidates = max_candidates
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # entry ID -> Entry
+        self.buckets = {}  # (band, band hash) -> set of entry IDs
+        self.next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def signature(self, text):
+        """MinHash signature of a normalized text."""
+        hashes = [zlib.crc32(shingle.encode()) for shingle in shingles(text)]
+        return tuple(min([h ^ mask for h in hashes]) for mask in self.masks)
+
+    def _bands(self, signature):
+        rows = self.rows
+        return [(band, hash(signature[band * rows:(band + 1) * rows])) for band in range(self.bands)]
+
+    def _context(self, messages):
+        """Signature of the given context messages taken together, or None if there are none."""
+        text = " ".join(normalize(message) for message in messages if message and message != "N/A").strip()
+        return self.signature(text) if text else None
+
+    def _agrees(self, signature, other):
+        if signature is None or other is None:
+            return signature is other
+        return similarity(signature, other) >= self.context_threshold
+
+    def get(self, target, context, msgr):
+        """Return the output of a near-duplicate verdict for this message, or None."""
+        text = normalize(target)
+        if len(text) < self.min_length:
+            return None
+        signature = self.signature(text)
+        # Only the candidates sharing the most bands are compared (bounded work when many entries look alike)
+        candidates = Counter()
+        for key in self._bands(signature):
+            candidates.update(self.buckets.get(key, ()))
+        best, best_score = None, self.threshold
+        now = time.time()
+        words = frozenset(text.split())
+        signatures = None  # (context, replied-to message), computed for the first close enough candidate
+        for entry_id, _ in candidates.most_common(self.max_candidates):
+            entry = self.entries[entry_id]
+            if entry.expires < now:
+                continue
+            score = similarity(signature, entry.signature)
+            if score >= best_score and (words ^ entry.words) <= FILLER_WORDS:
+                if signatures is None:
+                    signatures = (self._context(context), self._context((msgr,)))
+                if self._agrees(signatures[0], entry.context) and self._agrees(signatures[1], entry.reply):
+                    best, best_score = entry, score
+        if best is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return best.output
+
+    def put(self, target, context, msgr, output):
+        """Index a verdict produced by the model."""
+        text = normalize(target)
+        if len(text) < self.min_length:
+            return
+        signature = self.signature(text)
+        bands = self._bands(signature)
+        entry_id = self.next_id
+        self.next_id += 1
+        self.entries[entry_id] = Entry(signature, frozenset(text.split()), self._context(context), self._context((msgr,)),
+                                       output, time.time() + self.ttl, bands)
+        for key in bands:
+            self.buckets.setdefault(key, set()).add(entry_id)
+        while len(self.entries) > self.max_entries:
+            self._evict()
+
+    def _evict(self):
+        entry_id, entry = self.entries.popitem(last=False)
+        for key in entry.bands:
+            bucket = self.buckets[key]
+            bucket.discard(entry_id)
+            if not bucket:
+                del self.buckets[key]
+        self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0, "evictions": self.evictions}
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return sum(a == b for a, b in zip(signature, other)) / len(signature)
@@ -0,0 +1,229 @@
+import argparse
+import json
+import random
+import re
+import time
+
+# Fields every model output must contain (in output order)
+REQUIRED_FIELDS = (
+    "hate_speech_score", "target_race", "target_religion",
+    "target_origin", "target_gender", "target_sexuality",
+    "target_age", "target_disability"
+)
+
+# Appended to the system prompt in JSON response mode
+JSON_INSTRUCTION = (" Respond with a JSON object with the keys hate_speech_score (number), target_race, target_religion, "
+                    "target_origin, target_gender, target_sexuality, target_age and target_disability (booleans).")
+
+# Every field/value pair of a text output in a single pass. Tolerates quotes around keys and values,
+# '=' instead of ':', any casing of true/false and trailing punctuation ("False.", "2,").
+FIELD_PATTERN = re.compile(
+    r'\b(' + "|".join(REQUIRED_FIELDS) + r')\b["\']?\s*[:=]\s*["\']?(-?\d+(?:\.\d+)?|true|false)',
+    re.IGNORECASE
+)
+
+
+class ParseError(ValueError):
+    """Raised when a model output does not contain a valid verdict."""
+
+
+# Parsed model output
+class Verdict:
+    __slots__ = REQUIRED_FIELDS
+
+    def __init__(self, hate_speech_score, target_race, target_religion, target_origin, target_gender,
+                 target_sexuality, target_age, target_disability):
+        self.hate_speech_score = hate_speech_score
+        self.target_race = target_race
+        self.target_religion = target_religion
+        self.target_origin = target_origin
+        self.target_gender = target_gender
+        self.target_sexuality = target_sexuality
+        self.target_age = target_age
+        self.target_disability = target_disability
+
+    def flags(self):
+        """The seven category booleans (in policy.CATEGORIES order)."""
+        return (self.target_race, self.target_religion, self.target_origin, self.target_gender,
+                self.target_sexuality, self.target_age, self.target_disability)
+
+    def output(self):
+        """The verdict in the legacy text output format."""
+        return " ".join(f"{field}: {getattr(self, field)}" for field in REQUIRED_FIELDS)
+
+    def __eq__(self, other):
+        return isinstance(other, Verdict) and all(getattr(self, f) == getattr(other, f) for f in REQUIRED_FIELDS)
+
+    def __repr__(self):
+        return f"Verdict({self.output()})"
+
+
+def _score(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ParseError(f"Invalid hate_speech_score: {value!r}")
+
+def _flag(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    raise ParseError(f"Invalid flag: {value!r}")
+
+def parse_json(content):
+    """Parse a JSON (structured output) verdict."""
+    try:
+        data = json.loads(content)
+    except ValueError as e:
+        raise ParseError(f"Invalid JSON output: {e}")
+    if not isinstance(data, dict):
+        raise ParseError("JSON output is not an object")
+    missing = [field for field in REQUIRED_FIELDS if field not in data]
+    if missing:
+        raise ParseError(f"Missing fields: {', '.join(missing)}")
+    return Verdict(_score(data["hate_speech_score"]), *(_flag(data[field]) for field in REQUIRED_FIELDS[1:]))
+
+def parse_text(content):
+    """Parse a verdict in the legacy 'field: value' text format."""
+    values = {}
+    for match in FIELD_PATTERN.finditer(content):
+        values.setdefault(match.group(1).lower(), match.group(2))
+    if len(values) < len(REQUIRED_FIELDS):
+        missing = [field for field in REQUIRED_FIELDS if field not in values]
+        raise ParseError(f"Missing fields: {', '.join(missing)}")
+    return Verdict(_score(values["hate_speech_score"]), *(_flag(values[field]) for field in REQUIRED_FIELDS[1:]))
+
+def parse_output(content):
+    """Parse a model output (JSON or legacy text) into a Verdict, raising ParseError if it is invalid."""
+    if content is None:
+        raise ParseError("Empty output")
+    stripped = content.strip()
+    if stripped.startswith("{"):
+        return parse_json(stripped)
+    return parse_text(stripped)
+
+def is_valid_output(content):
+    try:
+        parse_output(content)
+    except ParseError:
+        return False
+    return True
+
+# Function to determine if the output matches the desired format
+def is_correct_format(output):
+    for field in REQUIRED_FIELDS:
+        if f"{field}:" not in output:
+            return False
+    return True
+
+def convert_value(value):
+    # Remove any trailing non-numeric characters (like the trailing period in "False.")
+    value = re.sub(r'\W+$', '', value)
+    # Convert to appropriate data type
+    if value.isdigit() or re.match(r'^-?\d+\.?\d*$', value):
+        return float(value)  # Handle integers and floats
+    elif value in ['True', 'False']:
+        return value == 'True'
+    return value
+
+def first_valid_content(completion, tries=5):
+    """Return the content of the first completion choice holding a valid verdict, or None."""
+    for choice in completion.choices[:tries]:
+        content = choice.message.content
+        if is_valid_output(content):
+            return content
+    return None
+
+
+# BENCHMARK AND FUZZING
+
+def legacy_parse(message):
+    """The previous parser: scrape str(message), then regex and convert_value (kept for the benchmark)."""
+    content_str = str(message).split("content='")[1].split("', role=")[0]
+    matches = re.finditer(r'(\w+):\s*([-\w.]+)', content_str)
+    converted_data = {m.group(1): convert_value(m.group(2)) for m in matches}
+    return Verdict(*(converted_data[field] for field in REQUIRED_FIELDS))
+
+class _Message:
+    # Stand-in for ChatCompletionMessage (same str() layout)
+    def __init__(self, content):
+        self.content = content
+
+    def __str__(self):
+        return f"ChatCompletionMessage(content={self.content!r}, role='assistant', function_call=None, tool_calls=None)"
+
+# Hand-written seeds for the fuzz corpus
+FUZZ_SEEDS = (
+    "hate_speech_score: 1 target_race: False target_religion: False target_origin: False target_gender: False "
+    "target_sexuality: False target_age: False target_disability: False",
+    "hate_speech_score: -2.5, target_race: true, target_religion: false, target_origin: false, target_gender: true, "
+    "target_sexuality: false, target_age: false, target_disability: false.",
+    "hate_speech_score: 3.\ntarget_race: True.\ntarget_religion: False\ntarget_origin: False\ntarget_gender: False\n"
+    "target_sexuality: False\ntarget_age: False\ntarget_disability: False.",
+    '{"hate_speech_score": 0.5, "target_race": false, "target_religion": false, "target_origin": false, '
+    '"target_gender": false, "target_sexuality": true, "target_age": false, "target_disability": false}',
+    "Sure! hate_speech_score: 2 target_race: False target_religion: False target_origin: False target_gender: False "
+    "target_sexuality: False target_age: False target_disability: False Note: the user's message isn't 'nice'.",
+)
+
+def fuzz_corpus(count, seed=0):
+    """Deterministic corpus of mutated model outputs (valid and invalid)."""
+    rng = random.Random(seed)
+    junk = ["'", '"', ":", ",", ".", "{", "}", "\n", " ", "-", "=", "True", "nan", "hate_speech_score", "\\"]
+    corpus = list(FUZZ_SEEDS)
+    while len(corpus) < count:
+        text = list(rng.choice(FUZZ_SEEDS))
+        for _ in range(rng.randint(1, 4)):
+            mutation = rng.random()
+            position = rng.randrange(len(text) + 1)
+            if mutation < 0.4:
+                text.insert(position, rng.choice(junk))
+            elif mutation < 0.7 and text:
+                del text[min(position, len(text) - 1):position + rng.randint(1, 20)]
+            elif mutation < 0.85:
+                text = text[:position]
+            else:
+                text = list("".join(text).upper() if rng.random() < 0.5 else "".join(text).replace(" ", "  "))
+        corpus.append("".join(text))
+    return corpus
+
+def fuzz(count, seed=0):
+    """Check that parse_output only ever returns a Verdict or raises ParseError; returns (valid, invalid)."""
+    valid = invalid = 0
+    for content in fuzz_corpus(count, seed):
+        try:
+            verdict = parse_output(content)
+        except ParseError:
+            invalid += 1
+            continue
+        assert isinstance(verdict.hate_speech_score, float) and all(isinstance(f, bool) for f in verdict.flags()), content
+        valid += 1
+    return valid, invalid
+
+def bench(count):
+    # Only the first seed is read correctly by the legacy parser (newlines and quotes break the str() scraping)
+    messages = [_Message(FUZZ_SEEDS[0]) for _ in range(count)]
+    assert legacy_parse(messages[0]) == parse_output(messages[0].content)
+    start = time.perf_counter()
+    for message in messages:
+        legacy_parse(message)
+    legacy = time.perf_counter() - start
+    start = time.perf_counter()
+    for message in messages:
+        parse_output(message.content)
+    fast = time.perf_counter() - start
+    print(f"{count} outputs: legacy {legacy / count * 1e6:.2f}us/output, parse_output {fast / count * 1e6:.2f}us/output "
+          f"({legacy / fast:.1f}x)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and fuzz the model output parser")
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    bench(args.count)
+    valid, invalid = fuzz(args.count, args.seed)
+    print(f"fuzz: {valid} valid, {invalid} rejected with ParseError, no other exceptions")
+
+if __name__ == "__main__":
+    main()
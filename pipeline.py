@@ -0,0 +1,212 @@
+from collections import Counter
+
+from classifier import ClassificationTimeout
+from parsing import parse_output, ParseError, REQUIRED_FIELDS
+from prefilter import BENIGN_OUTPUT
+from policy import rule_message
+from log_dispatcher import PRIORITIES, ERROR, BENIGN
+
+
+# Metrics recorded while handling messages
+class PipelineMetrics:
+    def __init__(self, registry):
+        self.stage_seconds = registry.histogram("ufoh_stage_seconds", "Time spent in each stage of handling a message", labels=("stage",))
+        self.verdict_actions = registry.counter("ufoh_verdicts_total", "Verdicts by resulting action", labels=("action",))
+        self.verdict_categories = registry.counter("ufoh_verdict_categories_total", "Verdicts flagging each category", labels=("category",))
+        self.verdict_sources = registry.counter("ufoh_verdict_sources_total", "Where verdicts came from", labels=("source",))
+        self.openai_tokens = registry.counter("ufoh_openai_tokens_total", "OpenAI token usage", labels=("type",))
+        # Messages skipped by the guilds' routing indexes, by reason (webhook, bot, channel, category, role, command, length)
+        self.skipped = Counter()
+        registry.collected_counter("ufoh_skipped_total", "Messages skipped before classification by reason",
+                                   lambda: {(reason,): count for reason, count in self.skipped.items()}, labels=("reason",))
+
+    def observe_completion(self, seconds, completion):
+        self.stage_seconds.observe(seconds, "openai")
+        usage = getattr(completion, "usage", None)
+        if usage is not None:
+            self.openai_tokens.inc("prompt", amount=usage.prompt_tokens)
+            self.openai_tokens.inc("completion", amount=usage.completion_tokens)
+
+
+# What on_message does with each message, independent of the live bot: everything it talks to is
+# passed in, so the same pipeline runs against Discord in main.py and against fakes in bench.py.
+# post_log(config, priority, content, view=None) queues a log entry; review_view(record) builds the
+# fine-tuning buttons for a review record. near_duplicates (optional) is consulted after an exact cache miss.
+class MessagePipeline:
+    def __init__(self, bot, guilds, admission, recent_messages, verdicts, prefilter, classifier, reviews, post_log,
+                 review_view, metrics, context_size=5, near_duplicates=None):
+        self.bot = bot
+        self.guilds = guilds
+        self.admission = admission
+        self.recent_messages = recent_messages
+        self.verdicts = verdicts
+        self.prefilter = prefilter
+        self.classifier = classifier  # Anything with `async classify(input)` (MicroBatcher or ClassifierProcessPool)
+        self.reviews = reviews
+        self.post_log = post_log
+        self.review_view = review_view
+        self.metrics = metrics
+        self.context_size = context_size
+        self.near_duplicates = near_duplicates
+
+    def lookup(self, content, context, msgr):
+        """Return (model output, source) without calling the model, or (None, None)."""
+        content_str = self.verdicts.get(content, context, msgr)
+        if content_str is not None:
+            return content_str, "cache"
+        if self.near_duplicates is not None:
+            # Reuse the verdict of a slight variation of an earlier message
+            content_str = self.near_duplicates.get(content, context, msgr)
+            if content_str is not None:
+                return content_str, "near_duplicate"
+        if self.prefilter is not None and self.prefilter.is_benign(content):
+            # Clearly benign: skip the model
+            return BENIGN_OUTPUT, "prefilter"
+        return None, None
+
+    async def handle(self, target):
+        bot = self.bot
+        recent_messages = self.recent_messages
+        post_log = self.post_log
+        stage_seconds = self.metrics.stage_seconds
+
+        # Every message (including our own) is context for the next one
+        recent_messages.add(target.channel.id, target.id, target.content)
+
+        # Ignore messages from the bot itself
+        if target.author == bot.user:
+            return
+
+        # Configuration of the guild the message was sent in (from memory)
+        config = self.guilds.get(target.guild.id if target.guild else 0)
+
+        # Skip messages the guild does not moderate (exempt roles/channels, bots, webhooks, commands, empty posts)
+        reason = config.routing.skip_reason(target)
+        if reason == "command" and not (await bot.get_context(target)).valid:
+            reason = None  # Only messages that invoke a registered command skip moderation
+        if reason is not None:
+            self.metrics.skipped[reason] += 1
+            await bot.process_commands(target)
+            return
+
+        # Variable to hold the content of the replied-to message, if it exists
+        msgr = "N/A"
+
+        # Check if the current message is a reply to another message
+        if target.reference and target.reference.resolved:
+            # If the reference is resolved, access the content directly
+            msgr = target.reference.resolved.content
+        elif target.reference:
+            # If the reference exists but is not resolved, look it up in the buffer before fetching the message
+            msgr = recent_messages.get(target.reference.channel_id, target.reference.message_id)
+            if msgr is None:
+                try:
+                    original_msg = await target.channel.fetch_message(target.reference.message_id)
+                    msgr = original_msg.content
+                except Exception as e:
+                    msgr = "N/A"
+
+        if msgr == "":
+            msgr == "N/A"
+
+        # Get the last five messages before the current one (messages[0] being the most recent one before the target
+        # message), only fetching them if the channel is not buffered yet
+        with stage_seconds.time("history"):
+            history = recent_messages.before(target.channel.id, target.id, self.context_size)
+            if history is None:
+                fetched = await target.channel.history(limit=self.context_size, before=target).flatten()
+                recent_messages.seed(target.channel.id, [(message.id, message.content) for message in fetched], self.context_size)
+                recent_messages.add(target.channel.id, target.id, target.content)
+                history = [message.content for message in fetched]
+
+        # Assign each message to a variable if they exist
+        msgn1 = history[0] if len(history) > 0 else "N/A"
+        msgn2 = history[1] if len(history) > 1 else "N/A"
+        msgn3 = history[2] if len(history) > 2 else "N/A"
+        msgn4 = history[3] if len(history) > 3 else "N/A"
+        msgn5 = history[4] if len(history) > 4 else "N/A"
+
+        # Reuse the model output for a message we have already seen (or clear it locally), otherwise call the OpenAI API
+        context = (msgn1, msgn2, msgn3, msgn4, msgn5)
+        content = target.content
+        content_str, source = self.lookup(content, context, msgr)
+        if content_str is None:
+            # Only messages that need the model are merged with the author's burst in this channel (None: merged into
+            # another unit), so cache hits and pre-filtered messages never wait for the debounce
+            with stage_seconds.time("admission"):
+                content = await self.admission.merge(config.guild_id, target.channel.id, target.author.id, content)
+            if content is None:
+                return
+            if content != target.content:
+                content_str, source = self.lookup(content, context, msgr)
+
+        input = "CONTEXT --- Message n-5:" + msgn5 + "Message n-4:" + msgn4 + "Message n-3:" + msgn3 + "Message n-2:" + msgn2 + "Message n-1:" + msgn1 + "Message Being Replied To:" + msgr + "TARGET --- Message To Evaluate: " + content
+
+        if content_str is not None:
+            self.metrics.verdict_sources.inc(source)
+        else:
+            # Model calls are budgeted per user, channel and guild; a unit still over budget is logged for manual review
+            with stage_seconds.time("budget"):
+                admitted = await self.admission.admit(config.guild_id, target.channel.id, target.author.id)
+            if not admitted:
+                self.metrics.verdict_sources.inc("over_budget")
+                post_log(config, ERROR, f"User: {target.author.mention}\n\nMessage: {content[:1500]}\n\nNot classified "
+                                        f"(over the classification budget during a burst of messages), please review it manually.")
+                return
+            try:
+                with stage_seconds.time("classify"):
+                    content_str = await self.classifier.classify(input)
+            except ClassificationTimeout:
+                post_log(config, ERROR, f"Model failed to parse message (classification timed out).")
+                return
+            except Exception as e:
+                # API, rate limit or connection errors: the message is not moderated, so say so in the logs
+                print(f"Classification failed ({type(e).__name__}: {e}).")
+                post_log(config, ERROR, f"User: {target.author.mention}\n\nMessage: {content[:1500]}\n\nNot classified "
+                                        f"(classification failed: {type(e).__name__}), please review it manually.")
+                return
+            self.metrics.verdict_sources.inc("model")
+            if content_str is not None:
+                self.verdicts.put(content, context, msgr, content_str)
+                if self.near_duplicates is not None:
+                    self.near_duplicates.put(content, context, msgr, content_str)
+
+        # MODERATION POLICY
+        # If no valid output is found, send error and terminate
+        if content_str is None:
+            post_log(config, ERROR, f"Model failed to parse message (no valid output).")
+            return
+
+        # Parse the output into a verdict
+        try:
+            with stage_seconds.time("parse"):
+                verdict = parse_output(content_str)
+        except ParseError as e:
+            post_log(config, ERROR, f"Model failed to parse message ({e}).")
+            return
+
+        # Initialize values
+        ai_hate_speech_score = verdict.hate_speech_score
+
+        # Ban/kick/warn actions disabled for testing purposes
+        for category, flagged in zip(REQUIRED_FIELDS[1:], verdict.flags()):
+            if flagged:
+                self.metrics.verdict_categories.inc(category)
+        if ai_hate_speech_score <= 0:
+            self.metrics.verdict_actions.inc("none")
+            post_log(config, BENIGN, f"User: {target.author.mention}\n\nMessage: {content[:1500]}\n\nModel Output: {content_str}\n\nNo action was taken (hate_speech_score <= 0).")
+            return
+        with stage_seconds.time("policy"):
+            action, rule = config.policy.evaluate(ai_hate_speech_score, verdict.flags())
+        self.metrics.verdict_actions.inc(action or "none")
+
+        # TAKE USER CORRECTION (buttons are sent with the verdict)
+        view = self.review_view(self.reviews.create(target.author.id, content, context, msgr, verdict))
+        if rule is not None:
+            self.admission.record_violation(config.guild_id, target.author.id)
+            post_log(config, PRIORITIES[action], f"User: {target.author.mention}\n\nMessage: {content[:1500]}\n\nModel Output: {content_str}\n\n{rule_message(rule, target.author.mention, ai_hate_speech_score)}", view)
+            #await getattr(target.author, action)(reason=rule.reason)
+        else: # debug
+            post_log(config, BENIGN, f"User: {target.author.mention}\n\nMessage: {content[:1500]}\n\nModel Output: {content_str}\n\nNo action was taken. (Hate speech score less than lowest threshold)", view)
+
+        await bot.process_commands(target)  # To allow other bot commands to work
@@ -0,0 +1,115 @@
+import argparse
+import random
+import time
+from collections import namedtuple
+
+# Default thresholds: if the score is above the threshold for a specific one, do something to the user.
+# Priority: ban > kick > warn
+DEFAULT_THRESHOLDS = {
+    'banhsth': 2, 'banraceth': 2, 'banreligionth': 2, 'banoriginth': 2,
+    'bangenderth': 2, 'bansexth': 2, 'banageth': 2, 'bandisth': 2,
+    'kickhsth': 1, 'kickraceth': 1, 'kickreligionth': 1, 'kickoriginth': 1,
+    'kickgenderth': 1, 'kicksexth': 1, 'kickageth': 1, 'kickdisth': 1,
+    'warnhsth': 0, 'warnraceth': 0, 'warnreligionth': 0, 'warnoriginth': 0,
+    'warngenderth': 0, 'warnsexth': 0, 'warnageth': 0, 'warndisth': 0
+}
+
+# Actions in priority order: (action, past tense, plural)
+ACTIONS = (("ban", "banned", "bans"), ("kick", "kicked", "kicks"), ("warn", "warned", "warns"))
+
+# Categories in the order they are checked: (threshold key infix, output field, moderation reason).
+# The flags passed to evaluate() follow the same order; general hate speech has no flag and is checked last.
+CATEGORIES = (
+    ("race", "target_race", "Racism"),
+    ("religion", "target_religion", "Religious discrimination"),
+    ("origin", "target_origin", "Ethnicity discrimination"),
+    ("gender", "target_gender", "Sexism"),
+    ("sex", "target_sexuality", "Homophobia/Transphobia"),
+    ("age", "target_age", "Ageism"),
+    ("dis", "target_disability", "Ableism")
+)
+GENERAL = ("hs", "general hate speech", "General hate speech")
+
+# One row of the decision table. flag is the index into the verdict's category flags (None for general hate speech).
+Rule = namedtuple("Rule", "action key flag threshold reason template")
+
+def rule_message(rule, mention, score):
+    """Log line for a matched rule, e.g. '@user was banned as the target_race threshold (2) for bans was exceeded (3.0)'."""
+    return rule.template.format(mention=mention, score=score)
+
+
+# Moderation policy compiled from a thresholds dict into a decision table. The table is rebuilt
+# only when the thresholds change (compile()), and evaluate() walks it once per verdict.
+class PolicyEngine:
+    def __init__(self, thresholds=None):
+        self.compile(thresholds or DEFAULT_THRESHOLDS)
+
+    def compile(self, thresholds):
+        """Rebuild the decision table from a thresholds dict."""
+        table = []
+        for action, past, plural in ACTIONS:
+            rules = []
+            for flag, (infix, field, reason) in enumerate(CATEGORIES + (GENERAL,)):
+                key = f"{action}{infix}th"
+                threshold = thresholds[key]
+                template = f"{{mention}} was {past} as the {field} threshold ({threshold}) for {plural} was exceeded ({{score}})"
+                rules.append(Rule(action, key, flag if flag < len(CATEGORIES) else None, threshold, reason, template))
+            # No rule of this action can match a score at or below its lowest threshold
+            table.append((min(rule.threshold for rule in rules), tuple(rules)))
+        self.table = tuple(table)
+
+    def evaluate(self, score, flags):
+        """Return (action, matched rule) for a verdict, or (None, None) if no threshold is exceeded.
+
+        flags holds the seven category booleans in CATEGORIES order.
+        """
+        for lowest, rules in self.table:
+            if score <= lowest:
+                continue
+            for rule in rules:
+                if score > rule.threshold and (rule.flag is None or flags[rule.flag]):
+                    return rule.action, rule
+        return None, None
+
+
+def reference_evaluate(thresholds, score, flags):
+    """Uncompiled evaluation (re-reads the thresholds dict for every check), used to verify the decision table."""
+    for action, _, _ in ACTIONS:
+        for flag, (infix, _, _) in enumerate(CATEGORIES):
+            if score > thresholds[f"{action}{infix}th"] and flags[flag]:
+                return action, f"{action}{infix}th"
+        if score > thresholds[f"{action}hsth"]:
+            return action, f"{action}hsth"
+    return None, None
+
+def synthetic_verdicts(count, seed=0):
+    rng = random.Random(seed)
+    return [(rng.uniform(-5, 5), tuple(rng.random() < 0.2 for _ in CATEGORIES)) for _ in range(count)]
+
+def random_thresholds(rng):
+    return {key: rng.randint(-1, 4) for key in DEFAULT_THRESHOLDS}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and check the compiled moderation policy offline")
+    parser.add_argument("--count", type=int, default=1_000_000, help="Number of synthetic verdicts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--random-thresholds", action="store_true", help="Use random thresholds instead of the defaults")
+    args = parser.parse_args()
+
+    thresholds = random_thresholds(random.Random(args.seed)) if args.random_thresholds else dict(DEFAULT_THRESHOLDS)
+    verdicts = synthetic_verdicts(args.count, args.seed)
+    engine = PolicyEngine(thresholds)
+
+    start = time.perf_counter()
+    compiled = [engine.evaluate(score, flags) for score, flags in verdicts]
+    compiled_time = time.perf_counter() - start
+    start = time.perf_counter()
+    reference = [reference_evaluate(thresholds, score, flags) for score, flags in verdicts]
+    reference_time = time.perf_counter() - start
+
+    mismatches = sum((action, rule.key if rule else None) != expected for (action, rule), expected in zip(compiled, reference))
+    print(f"{args.count} verdicts: compiled {compiled_time:.3f}s ({args.count / compiled_time:,.0f}/s), "
+          f"reference {reference_time:.3f}s ({args.count / reference_time:,.0f}/s), {mismatches} mismatches")
+
+if __name__ == "__main__":
+    main()
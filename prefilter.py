@@ -0,0 +1,149 @@
+import argparse
+import math
+import os
+import zlib
+from array import array
+
+# Hashed feature space (2^BITS weights) and character n-gram sizes
+BITS = 18
+NGRAMS = (3, 4)
+MAX_CHARS = 1000
+
+# Verdict given to messages the pre-filter clears without calling the model
+BENIGN_OUTPUT = ("hate_speech_score: 0 target_race: False target_religion: False target_origin: False "
+                 "target_gender: False target_sexuality: False target_age: False target_disability: False")
+
+def features(text, bits=BITS):
+    """Hashed word unigram and character n-gram indices for a message."""
+    text = " " + " ".join(text[:MAX_CHARS].lower().split()) + " "
+    mask = (1 << bits) - 1
+    indices = [zlib.crc32(b"w" + word.encode()) & mask for word in text.split()]
+    for n in NGRAMS:
+        indices.extend(zlib.crc32(text[i:i + n].encode()) & mask for i in range(len(text) - n + 1))
+    return indices
+
+
+# Hashed n-gram logistic regression estimating the probability that a message is hate speech.
+# Scoring is pure Python so the bot does not need NumPy at runtime.
+class HashedLinearModel:
+    def __init__(self, weights, bias, bits=BITS):
+        self.weights = weights
+        self.bias = bias
+        self.bits = bits
+
+    def score(self, text):
+        indices = features(text, self.bits)
+        weights = self.weights
+        z = self.bias + sum(weights[i] for i in indices) / math.sqrt(len(indices) or 1)
+        if z < -30:
+            return 0.0
+        return 1 / (1 + math.exp(-z))
+
+    def save(self, path):
+        # File layout: bias followed by the 2^bits weights, all float32
+        with open(path, 'wb') as f:
+            array('f', [self.bias]).tofile(f)
+            array('f', self.weights).tofile(f)
+
+    @classmethod
+    def load(cls, path):
+        values = array('f')
+        with open(path, 'rb') as f:
+            values.frombytes(f.read())
+        bits = (len(values) - 1).bit_length() - 1
+        return cls(values[1:], values[0], bits)
+
+
+def train(texts, labels, bits=BITS, epochs=3, lr=0.5, seed=0):
+    """Fit a HashedLinearModel with SGD (labels are 1 for hate speech, 0 otherwise)."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    weights = np.zeros(1 << bits, dtype=np.float32)
+    bias = 0.0
+    rows = [np.array(features(text, bits), dtype=np.int64) for text in texts]
+    scales = [1 / math.sqrt(len(row) or 1) for row in rows]
+    labels = np.asarray(labels, dtype=np.float32)
+    for epoch in range(epochs):
+        step = lr / (1 + epoch)
+        for i in rng.permutation(len(rows)):
+            z = bias + weights[rows[i]].sum() * scales[i]
+            gradient = 1 / (1 + math.exp(-max(min(z, 30), -30))) - labels[i]
+            np.add.at(weights, rows[i], -step * gradient * scales[i])
+            bias -= step * gradient
+    return HashedLinearModel(array('f', weights.tobytes()), bias, bits)
+
+
+# Cheap first tier in front of the model: messages scoring below benign_below are cleared
+# locally, everything else escalates to the fine-tuned model.
+class Prefilter:
+    def __init__(self, model, benign_below=0.05):
+        self.model = model
+        self.benign_below = benign_below
+        self.cleared = 0
+        self.escalated = 0
+
+    def is_benign(self, text):
+        """True if the message is clearly benign and can skip the model."""
+        if self.model.score(text) < self.benign_below:
+            self.cleared += 1
+            return True
+        self.escalated += 1
+        return False
+
+    def escalation_rate(self):
+        total = self.cleared + self.escalated
+        return self.escalated / total if total else 0.0
+
+    @classmethod
+    def from_file(cls, path, benign_below=0.05):
+        """Load a trained pre-filter, or return None if no model file exists."""
+        if not os.path.exists(path):
+            return None
+        return cls(HashedLinearModel.load(path), benign_below)
+
+
+def load_dataset():
+    import datasets
+
+    dataset = datasets.load_dataset('ucberkeley-dlab/measuring-hate-speech')
+    return dataset['train'].to_pandas()
+
+def report(model, df, start, size, cutoffs):
+    """Escalation rate and hate speech recall ceiling on the notebook's evaluation slice for each cut-off."""
+    from sklearn.metrics import classification_report
+
+    rows = df.loc[start:start + size - 1]
+    truth = (rows['hate_speech_score'] > 0).astype(int).tolist()
+    scores = [model.score(text) for text in rows['text']]
+    for cutoff in cutoffs:
+        escalated = [int(score >= cutoff) for score in scores]
+        hateful = sum(truth)
+        kept = sum(e for e, t in zip(escalated, truth) if t)
+        print(f"cut-off {cutoff}: escalation rate {sum(escalated) / len(escalated):.1%}, "
+              f"hate speech escalated (recall ceiling) {kept / hateful if hateful else 1:.1%}")
+        print(classification_report(truth, escalated, target_names=["Cleared", "Escalated"], zero_division=0))
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or evaluate the local pre-filter")
+    parser.add_argument("command", choices=["train", "report"])
+    parser.add_argument("--model", default="prefilter.bin")
+    parser.add_argument("--start", type=int, default=1000, help="First row of the evaluation slice (held out from training)")
+    parser.add_argument("--size", type=int, default=500)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--cutoffs", type=float, nargs="+", default=[0.02, 0.05, 0.1, 0.2])
+    args = parser.parse_args()
+
+    df = load_dataset()
+    if args.command == "train":
+        # Hold out the evaluation slice (every annotation of those comments) and train on one row per comment
+        held_out = set(df.loc[args.start:args.start + args.size - 1, 'comment_id'])
+        rows = df[~df['comment_id'].isin(held_out)].drop_duplicates('comment_id')
+        model = train(rows['text'].tolist(), (rows['hate_speech_score'] > 0).astype(int).tolist(), epochs=args.epochs)
+        model.save(args.model)
+        print(f"Trained on {len(rows)} comments, saved to {args.model}")
+    else:
+        report(HashedLinearModel.load(args.model), df, args.start, args.size, args.cutoffs)
+
+if __name__ == "__main__":
+    main()
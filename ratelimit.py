@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+
+# Token bucket: holds up to capacity tokens, refilled at rate tokens per second
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available right now; returns whether they were taken."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return False
+        self._refill(now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def refund(self, tokens=1):
+        """Give back tokens taken by try_acquire (e.g. when a later check fails)."""
+        self.tokens = min(self.capacity, self.tokens + tokens)
+
+    def delay(self, tokens=1):
+        """Seconds until tokens will be available."""
+        now = time.monotonic()
+        self._refill(now)
+        return max(self.paused_until - now, (tokens - self.tokens) / self.rate, 0.0)
+
+    async def acquire(self, tokens=1):
+        """Wait until tokens are available and take them."""
+        while not self.try_acquire(tokens):
+            await asyncio.sleep(self.delay(tokens))
+
+    def pause(self, seconds):
+        """Hand out no tokens for the next seconds (e.g. after a 429 with Retry-After)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+def is_rate_limit(error):
+    """True for HTTP 429 errors (openai.RateLimitError, nextcord.HTTPException, fakes)."""
+    return getattr(error, "status_code", None) == 429 or getattr(error, "status", None) == 429
+
+def retry_after(error, default=1.0):
+    """Seconds to wait before retrying after a 429, from the Retry-After header if there is one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", default))
+    except (TypeError, ValueError):
+        return default
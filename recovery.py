@@ -0,0 +1,73 @@
+import asyncio
+import random
+import time
+
+from parsing import first_valid_content
+
+
+# Recovery for malformed model outputs. Two modes:
+#   "n":     ask for several candidates in the same call and keep the first valid one (no extra round-trip)
+#   "retry": on a malformed output, retry the request after an exponential backoff with full jitter
+# The retry sleeps in the caller's task, so it never holds an engine worker while waiting.
+class RecoveryStrategy:
+    def __init__(self, engine, mode="retry", candidates=3, retries=1, base_delay=0.25, max_delay=2.0):
+        if mode not in ("n", "retry"):
+            raise ValueError(f"Unknown recovery mode: {mode}")
+        self.engine = engine
+        self.mode = mode
+        self.candidates = candidates if mode == "n" else 1
+        self.retries = retries if mode == "retry" else 0
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.outputs = 0  # Verdicts requested from the model (batched items count individually)
+        self.format_failures = 0
+        self.recovered = 0
+        self.unrecovered = 0
+        self.recovery_time = 0.0
+        self.max_recovery_time = 0.0
+
+    async def attempt(self, input):
+        """One model call; returns the first valid output among its choices, or None."""
+        options = {"n": self.candidates} if self.candidates > 1 else {}
+        self.outputs += 1
+        completion = await self.engine.classify(input, **options)
+        return first_valid_content(completion, self.candidates)
+
+    async def classify(self, input):
+        """Classify one input, recovering from a malformed output; returns the output or None."""
+        content = await self.attempt(input)
+        if content is None:
+            content = await self.recover(input, self.retries)
+        return content
+
+    async def recover(self, input, attempts=1):
+        """Record a format failure for input and retry it up to attempts times."""
+        self.format_failures += 1
+        start = time.perf_counter()
+        for attempt in range(attempts):
+            await asyncio.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+            content = await self.attempt(input)
+            if content is not None:
+                elapsed = time.perf_counter() - start
+                self.recovered += 1
+                self.recovery_time += elapsed
+                self.max_recovery_time = max(self.max_recovery_time, elapsed)
+                return content
+        self.unrecovered += 1
+        return None
+
+    def counters(self):
+        """Running totals behind stats() (summed across processes by the classifier pool)."""
+        return {"outputs": self.outputs, "format_failures": self.format_failures, "recovered": self.recovered,
+                "unrecovered": self.unrecovered, "recovery_time": self.recovery_time}
+
+    def stats(self):
+        return {
+            "outputs": self.outputs,
+            "format_failures": self.format_failures,
+            "format_failure_rate": self.format_failures / self.outputs if self.outputs else 0.0,
+            "recovered": self.recovered,
+            "unrecovered": self.unrecovered,
+            "mean_recovery_seconds": self.recovery_time / self.recovered if self.recovered else 0.0,
+            "max_recovery_seconds": self.max_recovery_time
+        }
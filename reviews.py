@@ -0,0 +1,163 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from parsing import REQUIRED_FIELDS
+
+
+# What a moderator review needs to rebuild the fine-tuning example: the target, its context and the
+# (possibly corrected) verdict, with the seven category flags packed into one int
+@dataclass(slots=True)
+class ReviewRecord:
+    id: int
+    author_id: int
+    content: str
+    context: tuple
+    msgr: str
+    score: float
+    flags: int
+    submitted: bool = False
+
+    def flag(self, index):
+        return bool(self.flags >> index & 1)
+
+    def toggle(self, index):
+        self.flags ^= 1 << index
+
+    def output(self):
+        """The corrected verdict in the model's output format."""
+        flags = " ".join(f"{field}: {self.flag(i)}" for i, field in enumerate(REQUIRED_FIELDS[1:]))
+        return f"hate_speech_score: {self.score} {flags}"
+
+
+def pack_flags(flags):
+    return sum(1 << i for i, flag in enumerate(flags) if flag)
+
+
+# Review records stored by ID in SQLite, with the most recently used ones cached in memory. Only
+# the newest max_rows records are kept on disk, so both memory and disk use stay bounded. IDs are
+# allocated in memory and new or changed records are written by a background task every
+# flush_interval seconds (one transaction in a worker thread), so the event loop never waits on disk.
+# IDs come from blocks of id_block reserved in the database ahead of use, so an ID handed out before
+# a crash (and already in a button's custom_id) is never handed out again after a restart.
+class ReviewStore:
+    def __init__(self, path='reviews.db', max_cached=1000, max_rows=100000, flush_interval=1.0, id_block=1000):
+        self.max_cached = max_cached
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.id_block = id_block
+        self.cache = OrderedDict()
+        self.dirty = {}  # record ID -> record not written yet
+        self.writing = {}  # record ID -> record being written by the background task
+        self._lock = threading.Lock()
+        self._task = None
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS reviews (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            author_id INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            context TEXT NOT NULL,
+            msgr TEXT NOT NULL,
+            score REAL NOT NULL,
+            flags INTEGER NOT NULL,
+            submitted INTEGER NOT NULL DEFAULT 0
+        )""")
+        self.db.execute("CREATE TABLE IF NOT EXISTS review_ids (reserved INTEGER NOT NULL)")
+        self.db.commit()
+        reserved = self.db.execute("SELECT reserved FROM review_ids").fetchone()
+        self.next_id = max((self.db.execute("SELECT MAX(id) FROM reviews").fetchone()[0] or 0) + 1,
+                           reserved[0] if reserved else 1)
+        self.reserved = 0  # IDs below this are reserved in the database
+        self.reserve()
+
+    def _cache(self, record):
+        self.cache[record.id] = record
+        self.cache.move_to_end(record.id)
+        while len(self.cache) > self.max_cached:
+            self.cache.popitem(last=False)
+
+    def _reserve(self):
+        # Record a new upper bound for handed-out IDs (caller holds the lock and commits)
+        reserved = self.next_id + self.id_block
+        self.db.execute("DELETE FROM review_ids")
+        self.db.execute("INSERT INTO review_ids (reserved) VALUES (?)", (reserved,))
+        self.reserved = max(self.reserved, reserved)
+
+    def reserve(self):
+        """Reserve the next block of IDs now."""
+        with self._lock:
+            self._reserve()
+            self.db.commit()
+
+    def create(self, author_id, content, context, msgr, verdict):
+        """Create a review for a verdict and return its record (written to disk in the background)."""
+        if self.next_id >= self.reserved:
+            self.reserve()  # The background writer normally extends the reservation before this happens
+        record = ReviewRecord(self.next_id, author_id, content, tuple(context), msgr, verdict.hate_speech_score,
+                              pack_flags(verdict.flags()))
+        self.next_id += 1
+        self.dirty[record.id] = record
+        self._cache(record)
+        return record
+
+    def get(self, record_id):
+        """Return a review record, or None if it no longer exists."""
+        record = self.cache.get(record_id) or self.dirty.get(record_id) or self.writing.get(record_id)
+        if record is None:
+            with self._lock:
+                row = self.db.execute("SELECT id, author_id, content, context, msgr, score, flags, submitted FROM reviews WHERE id = ?",
+                                      (record_id,)).fetchone()
+            if row is None:
+                return None
+            record = ReviewRecord(row[0], row[1], row[2], tuple(json.loads(row[3])), row[4], row[5], row[6], bool(row[7]))
+        self._cache(record)
+        return record
+
+    def update(self, record):
+        """Queue a changed record for writing."""
+        self.dirty[record.id] = record
+
+    def write(self, records):
+        """Insert or update records in one transaction, dropping rows older than the newest max_rows."""
+        rows = [(record.id, record.author_id, record.content, json.dumps(record.context), record.msgr, record.score,
+                 record.flags, int(record.submitted)) for record in records]
+        with self._lock:
+            self.db.executemany("INSERT OR REPLACE INTO reviews (id, author_id, content, context, msgr, score, flags, submitted) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.execute("DELETE FROM reviews WHERE id <= ?", (self.next_id - 1 - self.max_rows,))
+            if self.next_id + self.id_block // 2 >= self.reserved:
+                self._reserve()
+            self.db.commit()
+
+    async def flush(self):
+        """Write every queued record (in a worker thread)."""
+        if not self.dirty or self.writing:
+            return
+        self.writing, self.dirty = self.dirty, {}
+        try:
+            await asyncio.to_thread(self.write, list(self.writing.values()))
+        except Exception as e:
+            # Put the records back (newer changes win) so the next flush retries them
+            print(f"Could not save reviews ({e}).")
+            self.dirty = {**self.writing, **self.dirty}
+        finally:
+            self.writing = {}
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._writer())
+
+    async def _writer(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def close(self):
+        """Write whatever is still queued and close the database."""
+        self.write(list({**self.writing, **self.dirty}.values()))
+        self.db.close()
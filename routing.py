@@ -0,0 +1,51 @@
+# Defaults for guilds that never configured routing
+DEFAULT_ROUTING = {
+    "exempt_roles": [],
+    "exempt_channels": [],
+    "exempt_categories": [],
+    "ignore_bots": True,
+    "ignore_webhooks": True,
+    "min_length": 1,  # Attachment-only posts have no content to classify
+    "command_prefixes": []  # Messages with these prefixes are skipped only if they invoke a registered command
+}
+
+
+# Decides whether a message is in scope for moderation. Built once from a guild's flags (and rebuilt
+# when they change) so each check is a few set lookups.
+class RoutingIndex:
+    __slots__ = ("exempt_roles", "exempt_channels", "exempt_categories", "ignore_bots", "ignore_webhooks",
+                 "min_length", "command_prefixes")
+
+    def __init__(self, flags):
+        settings = {**DEFAULT_ROUTING, **{key: flags[key] for key in DEFAULT_ROUTING if key in flags}}
+        self.exempt_roles = frozenset(settings["exempt_roles"])
+        self.exempt_channels = frozenset(settings["exempt_channels"])
+        self.exempt_categories = frozenset(settings["exempt_categories"])
+        self.ignore_bots = settings["ignore_bots"]
+        self.ignore_webhooks = settings["ignore_webhooks"]
+        self.min_length = settings["min_length"]
+        self.command_prefixes = tuple(settings["command_prefixes"])
+
+    def skip_reason(self, message):
+        """Return why a message is out of scope ("webhook", "bot", "channel", ...), or None to moderate it.
+
+        "command" only means the message starts with a command prefix; the caller checks it is a real command.
+        """
+        if message.webhook_id is not None:
+            if self.ignore_webhooks:
+                return "webhook"
+        elif message.author.bot and self.ignore_bots:
+            return "bot"
+        channel = message.channel
+        if channel.id in self.exempt_channels or getattr(channel, "parent_id", None) in self.exempt_channels:
+            return "channel"
+        if getattr(channel, "category_id", None) in self.exempt_categories:
+            return "category"
+        if self.exempt_roles and not self.exempt_roles.isdisjoint(role.id for role in getattr(message.author, "roles", ())):
+            return "role"
+        content = message.content
+        if self.command_prefixes and content.startswith(self.command_prefixes):
+            return "command"
+        if len(content.strip()) < self.min_length:
+            return "length"
+        return None
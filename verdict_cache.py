@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+
+def normalize(text):
+    """Lowercase and collapse whitespace so trivial variations share a cache entry."""
+    return " ".join(text.lower().split())
+
+def digest(*parts):
+    return hashlib.blake2b("\x1f".join(normalize(part) for part in parts).encode(), digest_size=16).hexdigest()
+
+
+# Content-addressed cache of model outputs. Entries are keyed on a hash of the normalized target,
+# its five context messages and the replied-to message. Short targets (where context rarely
+# changes the verdict) are also stored under a cheaper key on the target alone.
+class VerdictCache:
+    def __init__(self, max_entries=10000, ttl=6 * 60 * 60, short_length=12, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.short_length = short_length
+        self.path = path
+        self.entries = OrderedDict()  # key -> (expiry timestamp, model output)
+        self.hits = 0
+        self.fallback_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.memory = 0  # Approximate bytes held by keys and outputs
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def keys(self, target, context, msgr):
+        """Return the full key and, for short targets, the target-only fallback key."""
+        full = "c:" + digest(target, *context, msgr)
+        short = "t:" + digest(target) if len(normalize(target)) <= self.short_length else None
+        return full, short
+
+    def get(self, target, context, msgr):
+        """Return the cached model output for this message, or None."""
+        full, short = self.keys(target, context, msgr)
+        content = self._lookup(full)
+        if content is not None:
+            self.hits += 1
+            return content
+        if short is not None:
+            content = self._lookup(short)
+            if content is not None:
+                self.fallback_hits += 1
+                return content
+        self.misses += 1
+        return None
+
+    def put(self, target, context, msgr, content):
+        full, short = self.keys(target, context, msgr)
+        expires = time.time() + self.ttl
+        self._store(full, expires, content)
+        if short is not None:
+            self._store(short, expires, content)
+
+    def _lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def _store(self, key, expires, content):
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (expires, content)
+        self.memory += self._size(key, content)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, content = self.entries.pop(key)
+        self.memory -= self._size(key, content)
+
+    @staticmethod
+    def _size(key, content):
+        return sys.getsizeof(key) + sys.getsizeof(content)
+
+    def stats(self):
+        lookups = self.hits + self.fallback_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "fallback_hits": self.fallback_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.fallback_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "memory_bytes": self.memory
+        }
+
+    def snapshot(self):
+        """Unexpired entries as [key, expiry, output] lists (call on the thread that updates the cache)."""
+        now = time.time()
+        return [[key, expires, content] for key, (expires, content) in list(self.entries.items()) if expires >= now]
+
+    def save(self, path=None, data=None):
+        """Write unexpired entries (or a snapshot taken earlier) to a local JSON file (atomically)."""
+        path = path or self.path
+        if data is None:
+            data = self.snapshot()
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    def load(self, path=None):
+        """Load entries saved by save(), skipping any that have expired."""
+        path = path or self.path
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not load verdict cache ({e}).")
+            return
+        now = time.time()
+        for key, expires, content in data:
+            if expires >= now:
+                self._store(key, expires, content)
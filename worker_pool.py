@@ -0,0 +1,247 @@
+import asyncio
+import importlib
+import itertools
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+from classifier import ClassificationEngine, ClassificationTimeout
+from recovery import RecoveryStrategy
+from batching import MicroBatcher
+
+
+def openai_client():
+    # Default client factory (runs in the worker process; reads OPENAI_API_KEY from the environment)
+    from openai import AsyncOpenAI
+    return AsyncOpenAI()
+
+def load_factory(name):
+    """Resolve a "module:function" client factory."""
+    module, function = name.split(":")
+    return getattr(importlib.import_module(module), function)
+
+async def serve(settings, reader, out):
+    """Classify JSON-line requests from reader and write JSON-line results to out until EOF."""
+    observations = []  # [seconds, prompt tokens, completion tokens] not reported yet
+
+    def observe(seconds, completion):
+        usage = getattr(completion, "usage", None)
+        observations.append([seconds, usage.prompt_tokens if usage else 0, usage.completion_tokens if usage else 0])
+
+    client = load_factory(settings["client"])()
+    engine = ClassificationEngine(client, settings["model"], settings["role"], observe=observe, **settings["engine"])
+    recovery = RecoveryStrategy(engine, **settings["recovery"])
+    batcher = MicroBatcher(recovery, **settings["batch"])
+    reported = recovery.counters()
+    running = set()
+
+    async def handle(request_id, input):
+        nonlocal reported
+        try:
+            status, value = "ok", await batcher.classify(input)
+        except ClassificationTimeout as e:
+            status, value = "timeout", str(e)
+        except Exception as e:
+            status, value = "error", f"{type(e).__name__}: {e}"
+        counters = recovery.counters()
+        changes = {name: counters[name] - reported[name] for name in counters}
+        reported = counters
+        out.write(json.dumps([request_id, status, value, observations, changes]) + "\n")
+        out.flush()
+        observations.clear()
+
+    while line := await reader.readline():
+        request_id, input = json.loads(line)
+        task = asyncio.create_task(handle(request_id, input))
+        running.add(task)
+        task.add_done_callback(running.discard)
+    await asyncio.gather(*running, return_exceptions=True)
+    await engine.stop()
+
+async def worker_main(settings):
+    # stdout carries results only; anything printed by the pipeline goes to stderr
+    out = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    sys.stdout = sys.stderr
+    reader = asyncio.StreamReader(limit=2 ** 24)
+    await asyncio.get_running_loop().connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    await serve(settings, reader, out)
+
+
+# A classifier worker process and the requests it has not answered yet
+class Worker:
+    __slots__ = ("process", "in_flight", "reader", "started", "alive")
+
+    def __init__(self, process):
+        self.process = process
+        self.in_flight = {}  # request ID -> (input, future, attempt)
+        self.reader = None
+        self.started = time.monotonic()
+        self.alive = True
+
+
+# Classification in separate processes, each with its own event loop, OpenAI client, engine, recovery
+# strategy and micro-batcher, so classification scales across cores and a crashing worker cannot
+# take the gateway down. Workers are plain subprocesses (`python worker_pool.py <settings>`) that
+# exchange JSON lines over stdin/stdout, so they never re-import the bot. Requests go to the least
+# loaded worker; a worker that exits is restarted and its in-flight requests are resubmitted once.
+# Workers that exit within min_uptime seconds of starting (e.g. a missing package or a bad key) are
+# restarted after an exponential backoff, and after max_failures such exits in a row they are not
+# restarted any more: requests then fail right away instead of spawning processes in a loop.
+class ClassifierProcessPool:
+    def __init__(self, processes, model, role, engine_options=None, recovery_options=None, batch_options=None,
+                 client_factory="worker_pool:openai_client", max_pending=256, timeout=120.0, observe=None,
+                 min_uptime=10.0, max_failures=5, base_delay=1.0, max_delay=60.0):
+        self.processes = processes
+        self.settings = json.dumps({"client": client_factory, "model": model, "role": role, "engine": engine_options or {},
+                                    "recovery": recovery_options or {}, "batch": batch_options or {}})
+        self.timeout = timeout
+        self.observe = observe  # Optional callback (seconds, completion) for every completion made by a worker
+        self.max_pending = max_pending
+        self.workers = []
+        self.ids = itertools.count()
+        self.slots = None
+        self.recovery_counters = {"outputs": 0, "format_failures": 0, "recovered": 0, "unrecovered": 0, "recovery_time": 0.0}
+        self.restarts = 0
+        self.min_uptime = min_uptime
+        self.max_failures = max_failures
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failures = 0  # Workers in a row that exited within min_uptime
+        self._starting = None
+        self._stopping = False
+
+    async def start(self):
+        """Spawn the workers (no-op if already running)."""
+        if self._starting is None:
+            self.slots = asyncio.Semaphore(self.max_pending)
+            self._starting = asyncio.ensure_future(self._start())
+        await self._starting
+
+    async def _start(self):
+        self.workers = [await self._spawn() for _ in range(self.processes)]
+        for worker in self.workers:
+            worker.reader = asyncio.create_task(self._read_results(worker))
+
+    async def stop(self):
+        """Stop the workers; requests still in flight are cancelled."""
+        if self._starting is None:
+            return
+        await self._starting
+        self._stopping = True
+        for worker in self.workers:
+            worker.process.stdin.close()
+        for worker in self.workers:
+            try:
+                await asyncio.wait_for(worker.process.wait(), 5)
+            except asyncio.TimeoutError:
+                worker.process.kill()
+            if not worker.alive:
+                worker.reader.cancel()  # It may be waiting to restart the worker
+            try:
+                await worker.reader
+            except asyncio.CancelledError:
+                pass
+            for _, future, _ in worker.in_flight.values():
+                future.cancel()
+        self.workers = []
+        self._starting = None
+        self._stopping = False
+
+    def pending(self):
+        """Requests sent to a worker and not answered yet."""
+        return sum(len(worker.in_flight) for worker in self.workers)
+
+    async def classify(self, input):
+        """Classify one input in a worker process; returns its model output, or None if no valid output was produced."""
+        await self.start()
+        if not any(worker.alive for worker in self.workers) and self.failures > self.max_failures:
+            print("Classifier workers keep exiting at start-up and are no longer restarted.")
+            return None
+        async with self.slots:
+            request_id = next(self.ids)
+            future = asyncio.get_running_loop().create_future()
+            self._send(request_id, input, future, 0)
+            try:
+                status, value = await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                for worker in self.workers:
+                    worker.in_flight.pop(request_id, None)
+                raise ClassificationTimeout(f"No result from the classifier processes after {self.timeout}s")
+        if status == "ok":
+            return value
+        if status == "timeout":
+            raise ClassificationTimeout(value)
+        print(f"Classifier worker failed ({value}).")
+        return None
+
+    async def _spawn(self):
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), self.settings,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, limit=2 ** 24)
+        return Worker(process)
+
+    def _send(self, request_id, input, future, attempt):
+        alive = [worker for worker in self.workers if worker.alive]
+        if not alive:
+            # Every worker is waiting to be restarted: the request is sent when one is back
+            self.workers[0].in_flight[request_id] = (input, future, attempt - 1)
+            return
+        worker = min(alive, key=lambda worker: len(worker.in_flight))
+        worker.in_flight[request_id] = (input, future, attempt)
+        worker.process.stdin.write((json.dumps([request_id, input]) + "\n").encode())
+
+    async def _read_results(self, worker):
+        while line := await worker.process.stdout.readline():
+            try:
+                request_id, status, value, observations, changes = json.loads(line)
+            except ValueError:
+                continue
+            for name, change in changes.items():
+                self.recovery_counters[name] += change
+            if self.observe is not None:
+                for seconds, prompt_tokens, completion_tokens in observations:
+                    usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+                    self.observe(seconds, SimpleNamespace(usage=usage))
+            entry = worker.in_flight.pop(request_id, None)
+            if entry is not None and not entry[1].done():
+                entry[1].set_result((status, value))
+        if not self._stopping:
+            await self._restart(worker)
+
+    async def _restart(self, crashed):
+        crashed.alive = False
+        code = await crashed.process.wait()
+        if time.monotonic() - crashed.started < self.min_uptime:
+            self.failures += 1
+        else:
+            self.failures = 0
+        if self.failures > self.max_failures:
+            print(f"Classifier worker {crashed.process.pid} exited with code {code}; {self.failures} workers in a row "
+                  f"exited at start-up, not restarting it.")
+            for _, future, _ in crashed.in_flight.values():
+                if not future.done():
+                    future.set_result(("error", "classifier workers keep exiting at start-up"))
+            crashed.in_flight.clear()
+            return
+        delay = min(self.max_delay, self.base_delay * 2 ** (self.failures - 1)) if self.failures else 0
+        print(f"Classifier worker {crashed.process.pid} exited with code {code}, restarting it in {delay:g}s.")
+        await asyncio.sleep(delay)
+        if self._stopping:
+            return
+        self.restarts += 1
+        worker = await self._spawn()
+        self.workers[self.workers.index(crashed)] = worker
+        worker.reader = asyncio.create_task(self._read_results(worker))
+        for request_id, (input, future, attempt) in crashed.in_flight.items():
+            if future.done():
+                continue
+            if attempt < 1:
+                self._send(request_id, input, future, attempt + 1)
+            else:
+                future.set_result(("error", "classifier worker exited twice while handling the request"))
+
+
+if __name__ == "__main__":
+    asyncio.run(worker_main(json.loads(sys.argv[1])))